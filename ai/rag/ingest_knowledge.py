@@ -1,50 +1,141 @@
-import chromadb
+"""
+Ingests the FinGuard knowledge base into the `finguard_knowledge` Chroma collection.
+
+Documents are read from a directory (ai/rag/knowledge by default; *.md and
+*.txt, with the sub-directory as category and the file name as topic), split
+into overlapping word chunks, and compared against a manifest of content
+hashes stored next to the Chroma database. Only new or changed chunks are
+embedded and upserted, and chunks whose source is gone are deleted, so a
+deploy that touches one policy document re-embeds only that document.
+
+    python ai/rag/ingest_knowledge.py
+    python ai/rag/ingest_knowledge.py --source policies/ --workers 8 --force
+"""
+import argparse
+import hashlib
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Documents are read and chunked by the same code that builds the BM25 keyword index
+sys.path.append(os.path.join(ROOT, "functions"))
+from src.utils.keyword_index import read_documents as load_documents, chunk_text
+
+DEFAULT_SOURCE = os.path.join(ROOT, "ai", "rag", "knowledge")
+DEFAULT_PERSIST = os.path.join(ROOT, "functions", "src", "utils", "chroma_db")
+COLLECTION = "finguard_knowledge"
+MANIFEST = "ingest_manifest.json"
+
+
+def build_chunks(documents, chunk_words=200, overlap=40):
+    """Chunk records keyed by id ('<doc id>#<n>'), each carrying its content hash."""
+    chunks = {}
+    for doc in documents:
+        parts = chunk_text(doc["text"], chunk_words, overlap)
+        for n, part in enumerate(parts):
+            metadata = {**doc["metadata"], "chunk": n, "chunks": len(parts)}
+            digest = hashlib.sha256((part + json.dumps(metadata, sort_keys=True)).encode()).hexdigest()
+            chunks[f"{doc['id']}#{n}"] = {"text": part, "metadata": metadata, "hash": digest}
+    return chunks
+
+
+def plan(chunks, manifest):
+    """Returns (ids to upsert, ids to delete) given the manifest of already ingested hashes."""
+    upserts = [cid for cid, chunk in chunks.items() if manifest.get(cid) != chunk["hash"]]
+    deletes = [cid for cid in manifest if cid not in chunks]
+    return upserts, deletes
+
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest(source=DEFAULT_SOURCE, persist_directory=DEFAULT_PERSIST, chunk_words=200, overlap=40,
+           batch_size=256, workers=4, force=False):
+    # Imported here so the planning helpers above work without chromadb installed
+    import chromadb
+    from chromadb.utils import embedding_functions
 
-# Define knowledge base documents
-DOCUMENTS = [
-    {
-        "id": "doc1",
-        "text": "FinGuard AI uses a multi-factor Ensemble Risk Engine combining XGBoost, Random Forest, and Logistic Regression. This provides a soft voting mechanism for fraud detection.",
-        "metadata": {"category": "technical", "topic": "risk_engine"}
-    },
-    {
-        "id": "doc2",
-        "text": "For high risk scores (above 75), users should immediately review their last 5 transactions and enable two-factor authentication on all linked bank accounts.",
-        "metadata": {"category": "advice", "topic": "high_risk"}
-    },
-    {
-        "id": "doc3",
-        "text": "The 50/30/20 budgeting rule suggests allocating 50% of income to Needs, 30% to Wants, and 20% to Savings or Debt Repayment.",
-        "metadata": {"category": "advice", "topic": "budgeting"}
-    },
-    {
-        "id": "doc4",
-        "text": "Emergency funds should ideally cover 3-6 months of essential living expenses. Start by saving small amounts daily to build this cushion.",
-        "metadata": {"category": "advice", "topic": "savings"}
-    },
-    {
-        "id": "doc5",
-        "text": "Field-level encryption (AES-256) is applied to sensitive transaction data in FinGuard AI, ensuring that merchants and descriptions remain private.",
-        "metadata": {"category": "technical", "topic": "privacy"}
-    }
-]
-
-def ingest():
     print("Initializing ChromaDB...")
-    # Using a local persistent directory for the showcase
-    persist_directory = os.path.join(os.getcwd(), "functions", "src", "utils", "chroma_db")
     client = chromadb.PersistentClient(path=persist_directory)
-    
-    collection = client.get_or_create_collection(name="finguard_knowledge")
-    
-    print(f"Ingesting {len(DOCUMENTS)} documents...")
-    collection.upsert(
-        documents=[doc["text"] for doc in DOCUMENTS],
-        metadatas=[doc["metadata"] for doc in DOCUMENTS],
-        ids=[doc["id"] for doc in DOCUMENTS]
-    )
-    print("Ingestion complete. Knowledge base is ready.")
+    collection = client.get_or_create_collection(name=COLLECTION)
+    embed = embedding_functions.DefaultEmbeddingFunction()
+    batch_size = max(1, min(batch_size, client.get_max_batch_size()))
+
+    manifest_path = os.path.join(persist_directory, MANIFEST)
+    manifest = None if force else _load_manifest(manifest_path)
+    if manifest is None or (manifest and collection.count() == 0):
+        # No usable manifest: reconcile against whatever the collection holds
+        manifest = {cid: None for cid in collection.get(include=[])["ids"]}
+
+    chunks = build_chunks(load_documents(source), chunk_words, overlap)
+    upserts, deletes = plan(chunks, manifest)
+    print(f"{len(chunks)} chunks from {source}: {len(upserts)} to embed, "
+          f"{len(chunks) - len(upserts)} unchanged, {len(deletes)} to delete")
+
+    for batch in _batches(deletes, batch_size):
+        collection.delete(ids=batch)
+        for cid in batch:
+            manifest.pop(cid, None)
+        _save_manifest(manifest_path, manifest)
+
+    started = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Embedding runs on the pool; each worker embeds a slice of the batch
+        for batch in _batches(upserts, batch_size):
+            texts = [chunks[cid]["text"] for cid in batch]
+            slice_size = max(1, -(-len(texts) // workers))
+            embeddings = [vector for part in pool.map(embed, list(_batches(texts, slice_size))) for vector in part]
+            collection.upsert(
+                ids=batch,
+                documents=texts,
+                metadatas=[chunks[cid]["metadata"] for cid in batch],
+                embeddings=embeddings
+            )
+            for cid in batch:
+                manifest[cid] = chunks[cid]["hash"]
+            _save_manifest(manifest_path, manifest)
+            done += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"  {done}/{len(upserts)} chunks embedded ({done / elapsed:.1f} chunks/s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Ingestion complete in {elapsed:.1f}s. Knowledge base is ready ({collection.count()} chunks).")
+    return {"chunks": len(chunks), "embedded": len(upserts), "deleted": len(deletes), "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Directory of knowledge documents")
+    parser.add_argument("--persist", default=DEFAULT_PERSIST, help="Chroma persistence directory")
+    parser.add_argument("--chunk-words", type=int, default=200, help="Words per chunk")
+    parser.add_argument("--overlap", type=int, default=40, help="Words shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per upsert/delete call")
+    parser.add_argument("--workers", type=int, default=4, help="Embedding worker threads")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and re-embed everything")
+    args = parser.parse_args(argv)
+    ingest(args.source, args.persist, args.chunk_words, args.overlap, args.batch_size, args.workers, args.force)
+
 
 if __name__ == "__main__":
-    ingest()
+    main()
@@ -0,0 +1,73 @@
+import sys
+import os
+
+# Add ai/rag to python path
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import pytest
+
+import ingest_knowledge
+from ingest_knowledge import build_chunks, chunk_text, load_documents, plan
+
+
+def test_chunks_overlap_and_cover_every_word():
+    words = [f"w{i}" for i in range(451)]
+    chunks = [chunk.split() for chunk in chunk_text(" ".join(words), chunk_words=200, overlap=40)]
+
+    assert [len(chunk) for chunk in chunks] == [200, 200, 131]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous[-40:] == chunk[:40]
+    # Dropping each chunk's overlap reassembles the text exactly
+    assert chunks[0] + [w for chunk in chunks[1:] for w in chunk[40:]] == words
+
+    assert chunk_text("short text", chunk_words=200, overlap=40) == ["short text"]
+    # The last chunk never consists of overlap alone
+    assert len(chunk_text(" ".join(words[:360]), chunk_words=200, overlap=40)) == 2
+
+
+def test_overlap_must_be_below_chunk_size():
+    for overlap in (200, 250, -1):
+        with pytest.raises(ValueError):
+            chunk_text("any text at all", chunk_words=200, overlap=overlap)
+
+
+def test_plan_skips_unchanged_hashes_and_deletes_removed_chunks(tmp_path):
+    (tmp_path / "advice").mkdir()
+    (tmp_path / "advice" / "savings.md").write_text("Save " * 300)
+    (tmp_path / "general.txt").write_text("Welcome to FinGuard.")
+    (tmp_path / "notes.pdf").write_text("ignored")
+
+    documents = list(load_documents(str(tmp_path)))
+    assert [doc["id"] for doc in documents] == ["advice/savings", "general"]
+    assert documents[0]["metadata"] == {"category": "advice", "topic": "savings",
+                                        "source": os.path.join("advice", "savings.md")}
+    chunks = build_chunks(documents)
+    assert sorted(chunks) == ["advice/savings#0", "advice/savings#1", "general#0"]
+
+    # First run: everything is new
+    assert plan(chunks, {}) == (list(chunks), [])
+    manifest = {cid: chunk["hash"] for cid, chunk in chunks.items()}
+    assert plan(chunks, manifest) == ([], [])
+
+    # Edit one document and delete the other
+    (tmp_path / "general.txt").unlink()
+    (tmp_path / "advice" / "savings.md").write_text("Save " * 100)
+    upserts, deletes = plan(build_chunks(load_documents(str(tmp_path))), manifest)
+    assert upserts == ["advice/savings#0"]
+    assert sorted(deletes) == ["advice/savings#1", "general#0"]
+
+    # A manifest rebuilt from collection ids alone re-embeds every chunk
+    assert plan(chunks, dict.fromkeys(chunks))[0] == list(chunks)
+
+
+def test_module_imports_without_chromadb():
+    assert "chromadb" not in vars(ingest_knowledge)
+
+
+def test_chroma_and_keyword_index_chunk_alike():
+    from src.utils.keyword_index import chunk_documents
+
+    documents = load_documents(ingest_knowledge.DEFAULT_SOURCE)
+    chunks = build_chunks(documents)
+    assert [(c["id"], c["text"]) for c in chunk_documents(documents)] == \
+        [(cid, chunk["text"]) for cid, chunk in chunks.items()]
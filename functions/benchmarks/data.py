@@ -0,0 +1,66 @@
+"""Seeded synthetic data for the benchmark suite."""
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+MERCHANT_TYPES = ['groceries', 'restaurants', 'utilities', 'electronics', 'travel', 'gambling', 'crypto']
+LOCATIONS = ['Mumbai', 'Delhi', 'Bengaluru', 'Pune', 'Chennai', 'Kolkata', 'Hyderabad', 'Jaipur']
+CATEGORIES = ['groceries', 'rent', 'salary', 'shopping', 'transport', 'cash_advance', 'gambling', 'pawn']
+
+# Fixed reference time so timestamps are identical across runs
+EPOCH_NOW = 1_760_000_000
+# The same instant as a naive UTC datetime, the way Firestore timestamps are compared
+REFERENCE_TIME = datetime.fromtimestamp(EPOCH_NOW, timezone.utc).replace(tzinfo=None)
+
+
+def engine_transactions(n, seed=0, now=EPOCH_NOW):
+    """Transactions in the shape RiskEngine expects (epoch-second timestamps)."""
+    rng = np.random.default_rng(seed)
+    amounts = rng.exponential(scale=800, size=n)
+    hours = rng.integers(0, 24, size=n)
+    merchants = rng.choice(MERCHANT_TYPES, size=n, p=[0.3, 0.2, 0.15, 0.15, 0.1, 0.05, 0.05])
+    locations = rng.choice(LOCATIONS, size=n)
+    timestamps = now - rng.integers(0, 30 * 86400, size=n)
+    return [{
+        'amount': float(amounts[i]),
+        'time_of_day': int(hours[i]),
+        'merchant_type': str(merchants[i]),
+        'location': str(locations[i]),
+        'timestamp': int(timestamps[i])
+    } for i in range(n)]
+
+
+def engine_batch(n, seed=0, now=EPOCH_NOW):
+    """The same transactions as engine_transactions, as a dict of column arrays."""
+    rows = engine_transactions(n, seed, now)
+    return {key: np.array([row[key] for row in rows]) for key in rows[0]} if rows else {}
+
+
+def trigger_transactions(n, seed=0, now=REFERENCE_TIME):
+    """Transactions as on_transaction_create reads them from Firestore (datetime timestamps)."""
+    rng = np.random.default_rng(seed)
+    amounts = -rng.exponential(scale=2000, size=n)
+    categories = rng.choice(CATEGORIES, size=n, p=[0.3, 0.1, 0.1, 0.2, 0.2, 0.04, 0.03, 0.03])
+    ages = rng.integers(0, 90 * 86400, size=n)
+    return [{
+        'amount': float(amounts[i]),
+        'category': str(categories[i]),
+        'timestamp': now - timedelta(seconds=int(ages[i]))
+    } for i in range(n)]
+
+
+def portfolio_csv(n, seed=0):
+    """A batch_analyze upload with n clients."""
+    rng = np.random.default_rng(seed)
+    income = rng.normal(60000, 20000, size=n).round(2)
+    expenses = (income * rng.uniform(0.3, 1.1, size=n)).round(2)
+    debt = (income * rng.uniform(0, 5, size=n)).round(2)
+    lines = ['client_id,income,expenses,debt']
+    lines += [f'client_{i},{income[i]},{expenses[i]},{debt[i]}' for i in range(n)]
+    return '\n'.join(lines) + '\n'
+
+
+def field_values(n, seed=0, length=40):
+    """Random printable strings standing in for encrypted merchant/description fields."""
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list('abcdefghijklmnopqrstuvwxyz0123456789 '))
+    return [''.join(rng.choice(alphabet, size=length)) for _ in range(n)]
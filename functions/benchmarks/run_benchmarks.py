@@ -0,0 +1,284 @@
+"""
+Benchmark suite for the risk scoring hot paths.
+
+Run from the functions directory:
+
+    python -m benchmarks.run_benchmarks --out benchmarks/results/baseline.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+
+Each benchmark reports p50/p99 latency per call and throughput in items per
+second. --compare exits non-zero when any benchmark's p50 latency regressed by
+more than --threshold against the stored baseline.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import data
+
+HISTORY_SIZES = [0, 100, 1000, 10000, 100000]
+QUICK_HISTORY_SIZES = [0, 100, 1000]
+
+# Registered benchmarks: name -> setup(quick) returning (callable, items per call),
+# optionally followed by a function returning extra fields for the result
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def measure(func, items=1, min_time=0.5, min_iterations=5, max_iterations=100000, warmup=2):
+    """Times repeated calls of func and summarizes latency and throughput."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_iterations or (time.perf_counter() < deadline and len(samples) < max_iterations):
+        started = time.perf_counter_ns()
+        func()
+        samples.append(time.perf_counter_ns() - started)
+    latencies = np.array(samples) / 1e6
+    return {
+        'iterations': len(samples),
+        'items_per_call': items,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'throughput_per_s': float(items * len(samples) / (latencies.sum() / 1000))
+    }
+
+
+def _engine(variant):
+    from src.utils.risk_engine import RiskEngine, MODEL_PATH
+    from src.utils.model_cache import get_model
+
+    engine = RiskEngine()
+    if variant == 'rules':
+        engine.model = None
+    elif variant == 'sklearn':
+        engine.model = get_model(MODEL_PATH)
+    return engine
+
+
+def _register_engine_benchmarks():
+    from src.utils.user_history import UserHistory
+
+    for variant in ('rules', 'compiled', 'sklearn'):
+        for size in HISTORY_SIZES:
+            for container in ('list', 'index'):
+                def setup(quick, variant=variant, size=size, container=container):
+                    if quick and size not in QUICK_HISTORY_SIZES:
+                        return None
+                    engine = _engine(variant)
+                    history = data.engine_transactions(size, seed=1)
+                    if container == 'index':
+                        history = UserHistory.from_transactions(history)
+                    transactions = itertools.cycle(data.engine_transactions(256, seed=2))
+                    return lambda: engine.calculate_risk_score(next(transactions), history), 1
+                benchmark(f'risk_engine.single[{variant},{container},history={size}]')(setup)
+
+        # With the compiled model loaded, batches still score with the sklearn ensemble
+        def batch_setup(quick, variant=variant):
+            if variant == 'compiled':
+                return None
+            engine = _engine(variant)
+            n = 10000 if quick else 100000
+            batch = data.engine_batch(n, seed=2)
+            history = data.engine_transactions(1000, seed=1)
+            return lambda: engine.calculate_risk_scores(batch, history), n
+        benchmark(f'risk_engine.batch[{variant}]')(batch_setup)
+
+
+@benchmark('trigger.calculate_risk_features')
+def _trigger_features(quick):
+    from src.triggers.on_transaction_create import calculate_risk_features
+    transactions = data.trigger_transactions(1000 if quick else 10000, seed=3)
+    # Scored as of the data's reference time, so the windows hold the same rows on every run
+    return lambda: calculate_risk_features(transactions, data.REFERENCE_TIME), len(transactions)
+
+
+@benchmark('batch_analyze.formula')
+def _batch_formula(quick):
+    from src.http.batch_analyze import iter_csv_chunks, score_clients
+    n = 10000 if quick else 100000
+    csv_text = data.portfolio_csv(n, seed=4)
+
+    def run():
+        for _, income, expenses, debt in iter_csv_chunks(io.StringIO(csv_text, newline='')):
+            score_clients(income, expenses, debt)
+    return run, n
+
+
+@benchmark('batch_analyze.handler')
+def _batch_handler(quick):
+    from src.http.batch_analyze import batch_analyze
+    from src.utils.local_harness import call_http, use_fake_firestore
+    n = 1000 if quick else 10000
+    csv_text = data.portfolio_csv(n, seed=4)
+    use_fake_firestore()
+    return lambda: call_http(batch_analyze, json={'analystId': 'bench', 'csv': csv_text}), n
+
+
+def _register_chat_benchmarks():
+    # A few milliseconds per snapshot read, as from a function to Firestore in-region
+    latency = 0.004
+    messages = ['what is my risk?', 'how do i build a budget', 'is my data secure', 'tips for savings']
+    for mode in ('word', 'chunked'):
+        def setup(quick, mode=mode):
+            from src.http.chat_stream import chat_stream
+            from src.utils.local_harness import stream_http, use_fake_firestore
+            use_fake_firestore(latency=latency)
+            cycle = itertools.cycle(messages)
+            ttfb, sizes = [], []
+
+            def run():
+                result = stream_http(chat_stream, json={'userId': 'bench', 'message': next(cycle), 'streamMode': mode})
+                ttfb.append(result['ttfb_ms'])
+                sizes.append(result['bytes'])
+
+            def report():
+                return {'ttfb_p50_ms': float(np.percentile(ttfb, 50)),
+                        'ttfb_p99_ms': float(np.percentile(ttfb, 99)),
+                        'bytes_per_response': float(np.mean(sizes))}
+            return run, 1, report
+        benchmark(f'chat_stream[{mode}]')(setup)
+
+
+@benchmark('rag.keyword_search')
+def _keyword_search(quick):
+    from src.utils.keyword_index import get_keyword_index
+    index = get_keyword_index()
+    queries = itertools.cycle(['what is my risk score?', 'how do i build a budget', 'is my data encrypted',
+                               'tips for savings', 'hello there'])
+    return lambda: index.search(next(queries), k=2), 1
+
+
+@benchmark('rag.embedding_cache.get')
+def _embedding_cache_get(quick):
+    import tempfile
+    from src.utils.embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(os.path.join(tempfile.mkdtemp(), 'embeddings.bin'), capacity=4096)
+    queries = [f'query {i}' for i in range(256)]
+    rng = np.random.default_rng(6)
+    for query in queries:
+        cache.put(query, rng.standard_normal(384))
+    cycle = itertools.cycle(queries + ['not cached'])
+    return lambda: cache.get(next(cycle)), 1
+
+
+@benchmark('encryption.encrypt')
+def _encrypt(quick):
+    from src.utils.encryption import encrypt
+    values = itertools.cycle(data.field_values(256, seed=5))
+    return lambda: encrypt(next(values)), 1
+
+
+@benchmark('encryption.decrypt')
+def _decrypt(quick):
+    from src.utils.encryption import encrypt_many, decrypt
+    tokens = itertools.cycle(encrypt_many(data.field_values(256, seed=5)))
+    return lambda: decrypt(next(tokens)), 1
+
+
+@benchmark('encryption.decrypt_many[1000,workers=4]')
+def _decrypt_many(quick):
+    from src.utils.encryption import encrypt_many, decrypt_many
+    tokens = encrypt_many(data.field_values(1000, seed=5))
+    return lambda: decrypt_many(tokens, max_workers=4), len(tokens)
+
+
+def run(selected, quick=False, min_time=0.5):
+    results = {}
+    for name in selected:
+        # Handler diagnostics are part of the measured cost but not of the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            prepared = BENCHMARKS[name](quick)
+            if prepared is None:
+                continue
+            func, items = prepared[:2]
+            results[name] = measure(func, items=items, min_time=min_time)
+            if len(prepared) > 2:
+                results[name].update(prepared[2]())
+        r = results[name]
+        line = (f"{name:60s} p50 {r['p50_ms']:10.3f}ms  p99 {r['p99_ms']:10.3f}ms  "
+                f"{r['throughput_per_s']:14.1f} items/s")
+        if 'ttfb_p50_ms' in r:
+            line += f"  ttfb p50 {r['ttfb_p50_ms']:.3f}ms  {r['bytes_per_response']:.0f} B/response"
+        print(line)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints p50 ratios against a baseline and returns the names that regressed."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['p50_ms'] / baseline[name]['p50_ms'] if baseline[name]['p50_ms'] else 1.0
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:60s} {baseline[name]['p50_ms']:10.3f}ms -> {result['p50_ms']:10.3f}ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed p50 slowdown before flagging (0.25 = 25%%)')
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this string')
+    parser.add_argument('--quick', action='store_true', help='Smaller sizes for a fast smoke run')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds spent timing each benchmark')
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings('ignore')
+    _register_engine_benchmarks()
+    _register_chat_benchmarks()
+    selected = [name for name in BENCHMARKS if args.filter in name]
+    results = run(selected, quick=args.quick, min_time=args.min_time)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({
+                'meta': {
+                    'created_at': datetime.now().isoformat(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'quick': args.quick
+                },
+                'results': results
+            }, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
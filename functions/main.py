@@ -1,19 +1,26 @@
-import firebase_admin
-from firebase_admin import credentials, initialize_app
+from src.utils.startup import timed_import, log_import_report
+
+firebase_admin = timed_import('firebase_admin')
 
 # Initialize Firebase Admin if not already initialized
 if not firebase_admin._apps:
     try:
-        initialize_app()
+        firebase_admin.initialize_app()
     except Exception as e:
         print(f"Error initializing Firebase Admin: {e}")
 
-# Import functions from src modules
-from src.triggers.on_transaction_create import on_transaction_create
-from src.http.chat_stream import chat_stream
-from src.http.batch_analyze import batch_analyze
-from src.http.generate_report import generate_report
-from src.scheduled.aggregate_metrics import aggregate_metrics
+# Import functions from src modules. Each handler module only imports what it needs
+# to register; heavy dependencies (Firestore client, chromadb, pandas, joblib,
+# cryptography) are loaded on first use inside the handler.
+on_transaction_create = timed_import('src.triggers.on_transaction_create').on_transaction_create
+chat_stream = timed_import('src.http.chat_stream').chat_stream
+batch_analyze = timed_import('src.http.batch_analyze').batch_analyze
+generate_report = timed_import('src.http.generate_report').generate_report
+aggregate_metrics = timed_import('src.scheduled.aggregate_metrics').aggregate_metrics
+sweep_risk_recomputes = timed_import('src.scheduled.sweep_risk_recomputes').sweep_risk_recomputes
+
+# Per-module import milliseconds, to keep cold-start regressions visible in the logs
+log_import_report()
 
 # Export all functions
 __all__ = [
@@ -21,5 +28,6 @@ __all__ = [
     "chat_stream",
     "batch_analyze",
     "generate_report",
-    "aggregate_metrics"
+    "aggregate_metrics",
+    "sweep_risk_recomputes"
 ]
@@ -1,15 +1,100 @@
 from firebase_functions import https_fn
-from firebase_admin import firestore, initialize_app
+from flask import stream_with_context
 import json
 import csv
 import io
 from datetime import datetime
+from src.utils import instrumentation
+from src.utils.firebase_client import get_db
+from src.utils.startup import lazy_module
 
-# Initialize Firebase Admin if not already initialized
-if not firestore.api_client:
-    initialize_app()
+firestore = lazy_module('firebase_admin.firestore')
+np = lazy_module('numpy')
 
-db = firestore.client()
+# Rows parsed, scored and stored together in streaming mode; keeps each
+# batch_results/{id}/chunks/{n} document well under Firestore's 1 MiB limit
+STREAM_CHUNK_ROWS = 2000
+
+def _parse_amounts(values):
+    """Parse a column of CSV strings as floats, returning (values, ok mask)"""
+    try:
+        return np.asarray(values, dtype=str).astype(float), np.ones(len(values), dtype=bool)
+    except ValueError:
+        parsed = np.zeros(len(values))
+        ok = np.ones(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            try:
+                parsed[i] = float(value)
+            except (ValueError, TypeError):
+                ok[i] = False
+        return parsed, ok
+
+def score_clients(income, expenses, debt):
+    """Vectorized form of the basic risk formula used by batch_analyze"""
+    risk = np.full(len(income), 30)
+    risk += np.where((income > 0) & (expenses > income * 0.8), 30, 0)
+    risk += np.where((income > 0) & (debt > income * 3), 25, 0)
+    return np.minimum(100, risk)
+
+def iter_csv_chunks(text_stream, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield (client_ids, income, expenses, debt) arrays for consecutive chunks of CSV rows"""
+    # Blank lines come through as [] rows; csv.DictReader (the legacy path) skips them
+    reader = (row for row in csv.reader(text_stream) if row)
+    header = next(reader, None)
+    if header is None:
+        return
+    index = {name: i for i, name in enumerate(header)}
+    
+    def column(rows, name, default):
+        if name not in index:
+            return [default] * len(rows)
+        i = index[name]
+        return [row[i] if i < len(row) else None for row in rows]
+    
+    while True:
+        rows = [row for _, row in zip(range(chunk_rows), reader)]
+        if not rows:
+            return
+        client_ids = column(rows, 'client_id', 'unknown')
+        income, ok_income = _parse_amounts(column(rows, 'income', '0'))
+        expenses, ok_expenses = _parse_amounts(column(rows, 'expenses', '0'))
+        debt, ok_debt = _parse_amounts(column(rows, 'debt', '0'))
+        # Like the row-by-row path, one unparseable field zeroes all three
+        ok = ok_income & ok_expenses & ok_debt
+        yield client_ids, np.where(ok, income, 0), np.where(ok, expenses, 0), np.where(ok, debt, 0)
+
+def stream_batch_results(analyst_id, text_stream):
+    """Score CSV rows chunk by chunk, store each chunk and yield NDJSON lines"""
+    db = get_db()
+    batch_ref = db.collection('analysts').document(analyst_id).collection('batch_results').document()
+    batch_ref.set({
+        'status': 'processing',
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'total_clients': 0
+    })
+    
+    total = 0
+    chunk_count = 0
+    for client_ids, income, expenses, debt in iter_csv_chunks(text_stream):
+        scores = score_clients(income, expenses, debt).tolist()
+        analyzed_at = datetime.now().isoformat()
+        results = [
+            {'client_id': client_id, 'risk_score': score, 'status': 'completed', 'analyzed_at': analyzed_at}
+            for client_id, score in zip(client_ids, scores)
+        ]
+        with instrumentation.span('firestore.batch_analyze.chunk_write'):
+            batch_ref.collection('chunks').document(f'{chunk_count:06d}').set({'results': results})
+        chunk_count += 1
+        total += len(results)
+        yield ''.join(json.dumps(result) + '\n' for result in results)
+    
+    batch_ref.update({
+        'status': 'completed',
+        'total_clients': total,
+        'chunk_count': chunk_count
+    })
+    instrumentation.maybe_emit('batch_analyze')
+    yield json.dumps({'done': True, 'batch_id': batch_ref.id, 'total_clients': total}) + '\n'
 
 @https_fn.on_request()
 def batch_analyze(req):
@@ -29,6 +114,23 @@ def batch_analyze(req):
         return https_fn.Response('Method not allowed', status=405, headers=headers)
     
     try:
+        # Streaming mode: raw text/csv body (analystId in the query string) or ?stream=1
+        if req.mimetype == 'text/csv':
+            analyst_id = req.args.get('analystId')
+            if not analyst_id:
+                return https_fn.Response(
+                    json.dumps({'success': False, 'error': 'Missing analystId'}),
+                    mimetype='application/json',
+                    status=400,
+                    headers=headers
+                )
+            text_stream = io.TextIOWrapper(req.stream, encoding='utf-8', newline='')
+            return https_fn.Response(
+                stream_with_context(stream_batch_results(analyst_id, text_stream)),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
+        
         data = req.get_json()
         analyst_id = data.get('analystId')
         csv_content = data.get('csv')  # Base64 or raw CSV string
@@ -41,6 +143,13 @@ def batch_analyze(req):
                 headers=headers
             )
 
+        if req.args.get('stream') == '1' or data.get('stream'):
+            return https_fn.Response(
+                stream_with_context(stream_batch_results(analyst_id, io.StringIO(csv_content, newline=''))),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
+        
         # Parse CSV
         csv_file = io.StringIO(csv_content)
         reader = csv.DictReader(csv_file)
@@ -70,14 +179,18 @@ def batch_analyze(req):
                 'analyzed_at': datetime.now().isoformat()
             })
         
-        # Store results for analyst
+        # Store results for analyst; committed before responding so a failed
+        # write is reported instead of handing out a batch_id that never lands
+        db = get_db()
         batch_ref = db.collection('analysts').document(analyst_id).collection('batch_results').document()
-        batch_ref.set({
-            'results': results,
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'total_clients': len(results)
-        })
+        with instrumentation.span('firestore.batch_analyze.write'):
+            batch_ref.set({
+                'results': results,
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'total_clients': len(results)
+            })
         
+        instrumentation.maybe_emit('batch_analyze')
         return https_fn.Response(
             json.dumps({'success': True, 'batch_id': batch_ref.id, 'results': results}),
             mimetype='application/json',
@@ -85,6 +198,7 @@ def batch_analyze(req):
         )
         
     except Exception as e:
+        instrumentation.error('batch_analyze', e)
         return https_fn.Response(
             json.dumps({'success': False, 'error': str(e)}),
             mimetype='application/json',
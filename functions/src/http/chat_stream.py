@@ -1,15 +1,33 @@
 from firebase_functions import https_fn
-from firebase_admin import firestore, initialize_app
 import json
+import os
 import re
-from src.utils.rag_service import get_rag_context
+import time
+from src.utils.rag_service import get_rag_context, normalize_query
+from src.utils import response_cache
 from src.utils.encryption import decrypt
+from src.utils import instrumentation
+from src.utils.firebase_client import get_db
+from src.utils.startup import lazy_module
 
-# Initialize Firebase Admin if not already initialized
-if not firestore.api_client:
-    initialize_app()
+firestore = lazy_module('firebase_admin.firestore')
 
-db = firestore.client()
+# 'chunked' coalesces tokens into frames and opens the stream before the
+# snapshot read and RAG retrieval; 'word' is the original one-event-per-word
+# stream, computed up front. A request may override it with "streamMode".
+STREAM_MODE = os.environ.get('CHAT_STREAM_MODE', 'chunked')
+
+# A chunked frame is flushed once it holds this many characters of text or
+# once its first token is older than this many milliseconds
+FRAME_BYTES = int(os.environ.get('CHAT_FRAME_BYTES', '256'))
+FRAME_MS = float(os.environ.get('CHAT_FRAME_MS', '50'))
+
+# Pre-encoded pieces of the SSE frames; only the token text is encoded per frame
+_FRAME_PREFIX = b'data: {"token": '
+_FRAME_SUFFIX = b'}\n\n'
+_DONE_FRAME = b'data: {"done": true}\n\n'
+# SSE comment line: ignored by EventSource clients, but gets headers and a first byte out
+_OPEN_FRAME = b': stream-open\n\n'
 
 KNOWLEDGE_BASE = {
     "high_risk": "Your risk score is elevated. Based on our Ensemble model (XGBoost/RF), you should immediately review your latest transactions.",
@@ -19,16 +37,24 @@ KNOWLEDGE_BASE = {
     "default": "I am your FinGuard AI advisor, specializing in risk management and financial wellness."
 }
 
+# Stands in for the user's score in cached answer templates
+SCORE_SLOT = '\x00score\x00'
+
 def simulate_llama_response(message, context, score):
     """
     Simulates a high-quality response from a fine-tuned Llama-3 model.
     Incorporates RAG context and user-specific risk data.
     """
-    prompt = f"[INST] User Query: {message}\nRisk Score: {score}\nContext: {context} [/INST]"
+    template = response_template(message, context, response_cache.score_bucket(score) == 'elevated')
+    return template.replace(SCORE_SLOT, str(score))
+
+def response_template(message, context, elevated):
+    """The simulated answer with SCORE_SLOT where the user's score goes"""
+    prompt = f"[INST] User Query: {message}\nRisk Score: {SCORE_SLOT}\nContext: {context} [/INST]"
     
     # Showcase Response Logic
-    if "risk" in message or score > 70:
-        return f"Based on your current risk score of {score}, and the context retrieved from our FinGuard knowledge base, I recommend immediate action. {context}. Our primary analysis indicates we should secure your account and review the individual factors contributing to this trend."
+    if "risk" in message or elevated:
+        return f"Based on your current risk score of {SCORE_SLOT}, and the context retrieved from our FinGuard knowledge base, I recommend immediate action. {context}. Our primary analysis indicates we should secure your account and review the individual factors contributing to this trend."
     
     if "privacy" in message or "secure" in message or "encryption" in message:
         return f"Regarding your query on data safety: {context}. We implement robust AES-256 field-level encryption across all transaction layers to ensure your merchant details and descriptions are never exposed to unauthorized entities."
@@ -39,6 +65,98 @@ def simulate_llama_response(message, context, score):
     return f"As your personal FinGuard AI advisor, I've analyzed your financial state. I recommend maintaining a 20% savings rate and monitoring your risk levels weekly. Is there a specific transaction category you're concerned about?"
 
 
+def tokenize(response):
+    """Split a response into the word tokens clients concatenate"""
+    for word in response.split():
+        yield word + ' '
+
+def coalesce_frames(tokens, max_bytes=FRAME_BYTES, max_ms=FRAME_MS, clock=time.monotonic):
+    """
+    Group tokens into encoded SSE frames.
+
+    The first token gets a frame of its own so it is sent as soon as it
+    exists. After that a frame is flushed when its text reaches max_bytes
+    characters or when its oldest token has waited max_ms. max_bytes=0 gives
+    one frame per token, byte-identical to the 'word' stream.
+    """
+    buffer = []
+    size = 0
+    opened = 0.0
+    first = True
+    for token in tokens:
+        if not buffer:
+            opened = clock()
+        buffer.append(token)
+        size += len(token)
+        if first or size >= max_bytes or (clock() - opened) * 1000 >= max_ms:
+            yield _FRAME_PREFIX + json.dumps(''.join(buffer)).encode() + _FRAME_SUFFIX
+            buffer = []
+            size = 0
+            first = False
+    if buffer:
+        yield _FRAME_PREFIX + json.dumps(''.join(buffer)).encode() + _FRAME_SUFFIX
+
+def get_risk_score(user_id):
+    """The user's latest risk score, read from the risk snapshot (only its value field)"""
+    db = get_db()
+    with instrumentation.span('firestore.chat_stream.risk_snapshot'):
+        risk_doc = db.collection('users').document(user_id).collection('risk_snapshots').document('latest') \
+            .get(field_paths=['value'])
+    risk_data = risk_doc.to_dict() or {}
+    return risk_data.get('value', 50)
+
+def compose_response(user_id, message):
+    """Read the user's risk score, retrieve RAG context and build the answer"""
+    score = get_risk_score(user_id)
+    
+    # Get RAG Context
+    context = get_rag_context(message)
+    
+    # Generate model-like response (Simulation of fine-tuned Llama/Gemma); the
+    # answer depends on the message, context and score bucket only, so
+    # frequent questions are served from the template cache
+    normalized = normalize_query(message)
+    key = response_cache.response_key(normalized, context, score)
+    template = response_cache.get_response(key)
+    if template is None:
+        instrumentation.incr('chat.response_cache_miss')
+        template = response_template(normalized, context, response_cache.score_bucket(score) == 'elevated')
+        response_cache.set_response(key, template)
+    else:
+        instrumentation.incr('chat.response_cache_hit')
+    return template.replace(SCORE_SLOT, str(score))
+
+def stream_chunked(user_id, message):
+    """Open the stream at once, then compose the answer and send it in coalesced frames"""
+    yield _OPEN_FRAME
+    try:
+        yield from coalesce_frames(tokenize(compose_response(user_id, message)))
+    except Exception as e:
+        instrumentation.error('chat_stream', e)
+        yield b'data: ' + json.dumps({'error': str(e)}).encode() + b'\n\n'
+        return
+    yield _DONE_FRAME
+
+def instrumented_stream(frames, started):
+    """
+    Passes frames through, timing the stream as it is consumed.
+
+    Records time to the first frame (chat_stream.ttfb) and to the last
+    (chat_stream.generate) from the request's start, plus bytes sent. Metrics
+    are emitted once the stream ends, so they include this response.
+    """
+    sent = 0
+    try:
+        for frame in frames:
+            if not sent:
+                instrumentation.observe('chat_stream.ttfb', (time.perf_counter() - started) * 1000)
+            sent += len(frame)
+            yield frame
+        instrumentation.observe('chat_stream.generate', (time.perf_counter() - started) * 1000)
+        instrumentation.incr('chat_stream.bytes', sent)
+    finally:
+        instrumentation.maybe_emit('chat_stream')
+
 @https_fn.on_request()
 def chat_stream(req):
     # Enable CORS
@@ -56,33 +174,27 @@ def chat_stream(req):
     if req.method != 'POST':
         return https_fn.Response('Method not allowed', status=405, headers=headers)
     
+    started = time.perf_counter()
     try:
         data = req.get_json()
         user_id = data.get('userId')
         message = data.get('message', '').lower()
         tier = data.get('tier', 'consumer')
+        mode = data.get('streamMode') or STREAM_MODE
         
         if not user_id:
             return https_fn.Response('User ID is required', status=400, headers=headers)
 
-        # Get user context
-        risk_doc = db.collection('users').document(user_id).collection('risk_snapshots').document('latest').get()
-        risk_data = risk_doc.to_dict() or {}
-        score = risk_data.get('value', 50)
-        
-        # Get RAG Context
-        context = get_rag_context(message)
-        
-        # Generate model-like response (Simulation of fine-tuned Llama/Gemma)
-        response = simulate_llama_response(message, context, score)
+        if mode == 'word':
+            # Streaming response simulation
+            response = compose_response(user_id, message)
 
-        
-        # Streaming response simulation
-        def generate():
-            words = response.split()
-            for word in words:
-                yield f"data: {json.dumps({'token': word + ' '})}\n\n"
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            def generate():
+                yield from coalesce_frames(tokenize(response), max_bytes=0)
+                yield _DONE_FRAME
+            body = generate()
+        else:
+            body = stream_chunked(user_id, message)
         
         stream_headers = {
             'Access-Control-Allow-Origin': '*',
@@ -92,9 +204,10 @@ def chat_stream(req):
         }
         
         return https_fn.Response(
-            generate(),
+            instrumented_stream(body, started),
             headers=stream_headers
         )
         
     except Exception as e:
+        instrumentation.error('chat_stream', e)
         return https_fn.Response(f"Error: {str(e)}", status=500, headers=headers)
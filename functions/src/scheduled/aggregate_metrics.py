@@ -1,56 +1,96 @@
 from firebase_functions import scheduler_fn
-from firebase_admin import firestore, initialize_app
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import os
+import time
+from src.utils import instrumentation
+from src.utils.firebase_client import WriteBuffer, get_db
+from src.utils.startup import lazy_module
 
-# Initialize Firebase Admin if not already initialized
-if not firestore.api_client:
-    initialize_app()
+firestore = lazy_module('firebase_admin.firestore')
 
-db = firestore.client()
+# Documents requested per get_all call
+SNAPSHOT_CHUNK_SIZE = 300
+
+# Institutions aggregated concurrently
+MAX_WORKERS = int(os.environ.get('AGGREGATE_MAX_WORKERS', '8'))
+
+def fetch_risk_scores(user_ids):
+    """Read the latest risk snapshot of every user with batched multi-document reads"""
+    db = get_db()
+    refs = [
+        db.collection('users').document(uid).collection('risk_snapshots').document('latest')
+        for uid in user_ids
+    ]
+    scores = []
+    reads = 0
+    for start in range(0, len(refs), SNAPSHOT_CHUNK_SIZE):
+        with instrumentation.span('firestore.aggregate_metrics.get_all'):
+            for risk_doc in db.get_all(refs[start:start + SNAPSHOT_CHUNK_SIZE], field_paths=['value']):
+                reads += 1
+                if risk_doc.exists:
+                    scores.append(risk_doc.to_dict().get('value', 50))
+    return scores, reads
+
+def aggregate_institution(inst, writes):
+    """Aggregate one institution's metrics into writes; returns timing and read counts for the run report"""
+    started = time.perf_counter()
+    inst_ref = inst.reference
+
+    # Get all linked users (keys only, the documents themselves are not needed)
+    with instrumentation.span('firestore.aggregate_metrics.user_keys'):
+        user_ids = [u.id for u in inst_ref.collection('users').select([]).stream()]
+    reads = len(user_ids)
+
+    if not user_ids:
+        return {'institution': inst.id, 'customers': 0, 'reads': reads,
+                'elapsed_ms': (time.perf_counter() - started) * 1000}
+
+    # Aggregate risk scores
+    scores, snapshot_reads = fetch_risk_scores(user_ids)
+    reads += snapshot_reads
+    total_risk = sum(scores)
+    high_risk_count = sum(1 for score in scores if score > 70)
+    critical_count = sum(1 for score in scores if score > 85)
+
+    avg_risk = total_risk / len(user_ids) if user_ids else 50
+
+    # Update metrics
+    writes.set(inst_ref.collection('metrics').document('realtime'), {
+        'average_risk': avg_risk,
+        'total_customers': len(user_ids),
+        'high_risk_count': high_risk_count,
+        'critical_count': critical_count,
+        'compliance_rate': 100 - (high_risk_count / len(user_ids) * 100) if user_ids else 100,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+
+    return {'institution': inst.id, 'customers': len(user_ids), 'reads': reads,
+            'elapsed_ms': (time.perf_counter() - started) * 1000}
 
 @scheduler_fn.on_schedule(schedule="every 5 minutes")
 def aggregate_metrics(event):
+    started = time.perf_counter()
+    db = get_db()
+
     # Get all institutions
-    institutions = db.collection('institutions').stream()
-    count = 0
-    
-    for inst in institutions:
-        inst_id = inst.id
-        inst_ref = inst.reference
-        count += 1
-        
-        # Get all linked users
-        users = inst_ref.collection('users').stream()
-        user_ids = [u.id for u in users]
-        
-        if not user_ids:
-            continue
-        
-        # Aggregate risk scores
-        total_risk = 0
-        high_risk_count = 0
-        critical_count = 0
-        
-        for uid in user_ids:
-            risk_doc = db.collection('users').document(uid).collection('risk_snapshots').document('latest').get()
-            if risk_doc.exists:
-                score = risk_doc.to_dict().get('value', 50)
-                total_risk += score
-                if score > 70:
-                    high_risk_count += 1
-                if score > 85:
-                    critical_count += 1
-        
-        avg_risk = total_risk / len(user_ids) if user_ids else 50
-        
-        # Update metrics
-        inst_ref.collection('metrics').document('realtime').set({
-            'average_risk': avg_risk,
-            'total_customers': len(user_ids),
-            'high_risk_count': high_risk_count,
-            'critical_count': critical_count,
-            'compliance_rate': 100 - (high_risk_count / len(user_ids) * 100) if user_ids else 100,
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
-    
-    return f"Aggregated {count} institutions"
+    institutions = list(db.collection('institutions').stream())
+
+    # Every institution's metrics document goes out in shared batched writes
+    writes = WriteBuffer(db)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        reports = list(pool.map(lambda inst: aggregate_institution(inst, writes), institutions))
+    writes.flush()
+
+    for report in reports:
+        instrumentation.observe('aggregate_metrics.institution', report['elapsed_ms'])
+        instrumentation.log('aggregate_metrics.institution', **report)
+
+    total_reads = sum(report['reads'] for report in reports) + len(institutions)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    instrumentation.incr('aggregate_metrics.reads', total_reads)
+    instrumentation.log('aggregate_metrics.run', institutions=len(institutions), reads=total_reads,
+                        elapsed_ms=round(elapsed_ms, 1))
+    instrumentation.maybe_emit('aggregate_metrics')
+
+    return f"Aggregated {len(institutions)} institutions"
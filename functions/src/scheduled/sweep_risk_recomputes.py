@@ -0,0 +1,11 @@
+from firebase_functions import scheduler_fn
+from src.triggers.on_transaction_create import sweep_stale_recomputes
+from src.utils import instrumentation
+
+@scheduler_fn.on_schedule(schedule="every 5 minutes")
+def sweep_risk_recomputes(event):
+    # Coalesced risk updates whose recomputing trigger died or handed off
+    recomputed = sweep_stale_recomputes()
+    instrumentation.incr('sweep_risk_recomputes.users', len(recomputed))
+    instrumentation.maybe_emit('sweep_risk_recomputes')
+    return f"Recomputed risk for {len(recomputed)} users"
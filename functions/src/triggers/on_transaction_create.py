@@ -1,33 +1,60 @@
 from firebase_functions import firestore_fn
-from firebase_admin import firestore, initialize_app
 import json
-from datetime import datetime, timedelta
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from src.utils.rolling_state import (
+    apply_transaction, build_state, is_applied, is_consistent, mark_applied, state_update, window_totals
+)
+from src.utils import instrumentation
+from src.utils.history_loader import load_history
+from src.utils.known_locations import INDEX_VERSION as LOCATIONS_INDEX_VERSION, record_location
+from src.utils.risk_features import extract_features
+from src.utils.firebase_client import WriteBuffer, get_db, run_transaction
+from src.utils.startup import lazy_module
 
-# Initialize Firebase Admin if not already initialized
-if not firestore.api_client:
-    initialize_app()
+firestore = lazy_module('firebase_admin.firestore')
 
-db = firestore.client()
+# 'incremental' folds each new transaction into users/{userId}/risk_state/rolling;
+# 'full' rescans the last 90 days on every trigger; 'coalesced' collapses a
+# burst of triggers for one user into a single rescan (see claim_recompute)
+RISK_STATE_MODE = os.environ.get('RISK_STATE_MODE', 'incremental')
 
-def calculate_risk_features(transactions):
+# Coalesced mode: how long the recomputing trigger waits for the rest of a
+# burst, and how long its claim is honoured before another trigger may take
+# over. The lease must stay below the function timeout (60 s by default) so
+# that a recomputing trigger killed by the timeout is taken over.
+COALESCE_WINDOW_MS = float(os.environ.get('RISK_COALESCE_WINDOW_MS', '2000'))
+COALESCE_LEASE_S = float(os.environ.get('RISK_COALESCE_LEASE_S', '45'))
+
+# Rescans one trigger runs for a burst before handing the rest to the next
+# trigger or to sweep_stale_recomputes
+COALESCE_MAX_ROUNDS = int(os.environ.get('RISK_COALESCE_MAX_ROUNDS', '5'))
+
+# Dirty markers, one document per user id, so stale ones can be found by a query
+PENDING_COLLECTION = 'risk_recompute_pending'
+
+def calculate_risk_features(transactions, now=None):
     """Calculate risk features from transaction list"""
     if not transactions:
         return {"score": 50, "factors": ["insufficient_data"]}
     
-    amounts = [t.get('amount', 0) for t in transactions]
-    categories = [t.get('category', 'unknown') for t in transactions]
-    
-    # Velocity features
-    now = datetime.now()
-    total_7d = sum(a for a, t in zip(amounts, transactions) 
-                   if t.get('timestamp', now).replace(tzinfo=None) > now - timedelta(days=7))
-    total_30d = sum(a for a, t in zip(amounts, transactions) 
-                    if t.get('timestamp', now).replace(tzinfo=None) > now - timedelta(days=30))
+    # Velocity and category features, in one columnar pass
+    features = extract_features(transactions, now)
     
-    # Category analysis
-    high_risk_cats = ['cash_advance', 'gambling', 'pawn']
-    high_risk_count = sum(1 for c in categories if c in high_risk_cats)
+    return score_risk_features(features['total_7d'], features['total_30d'],
+                               features['high_risk_count'], features['tx_count'])
+
+def calculate_risk_from_state(state, now=None):
+    """Calculate risk features from a rolling state document"""
+    if not state['tx_count']:
+        return {"score": 50, "factors": ["insufficient_data"]}
     
+    total_7d, total_30d = window_totals(state, now)
+    return score_risk_features(total_7d, total_30d, state['high_risk_count'], state['tx_count'])
+
+def score_risk_features(total_7d, total_30d, high_risk_count, tx_count):
+    """Score aggregated velocity and category features"""
     # Calculate score (0-100, higher = more risky)
     score = 30  # Base score
     
@@ -35,7 +62,7 @@ def calculate_risk_features(transactions):
         score += 20
     if high_risk_count > 0:
         score += 25
-    if len(transactions) < 5:  # New user
+    if tx_count < 5:  # New user
         score += 10
     
     factors = []
@@ -53,23 +80,62 @@ def calculate_risk_features(transactions):
         "total_30d": total_30d
     }
 
-@firestore_fn.on_document_created(document="users/{userId}/transactions/{txId}")
-def on_transaction_create(event):
-    user_id = event.params["userId"]
-    
-    # Get last 90 days of transactions
-    txs_ref = db.collection('users').document(user_id).collection('transactions')
-    cutoff = datetime.now() - timedelta(days=90)
-    # Note: Firestore query might require an index for order_by and where
-    txs = txs_ref.where('timestamp', '>', cutoff).order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
+def load_recent_transactions(user_id):
+    """Stream the user's last 90 days of transactions, projected to the fields scoring reads"""
+    return load_history(user_id, days=90)
+
+def update_rolling_state(user_id, transaction, tx_id=None):
+    """
+    Fold the new transaction into the user's rolling state and return it.
+
+    The stored document is changed with field increments and deletes so that
+    concurrent triggers never overwrite each other's buckets. If the state is
+    missing, from an older version, or its totals disagree with its buckets,
+    it is rebuilt from a full 90-day rescan instead. A redelivered tx_id is
+    not applied twice (see rolling_state).
+    """
+    db = get_db()
+    state_ref = db.collection('users').document(user_id).collection('risk_state').document('rolling')
+    with instrumentation.span('firestore.on_transaction_create.state_read'):
+        state_doc = state_ref.get()
+    state = state_doc.to_dict() if state_doc.exists else None
+    now = datetime.now()
     
-    transactions = [t.to_dict() for t in txs]
+    if transaction is None or not is_consistent(state):
+        history = load_recent_transactions(user_id)
+        state = mark_applied(build_state(history, now), tx_id, now)
+        if transaction is not None and transaction.get('location'):
+            record_location(user_id, transaction['location'], history)
+            state['locations_indexed'] = LOCATIONS_INDEX_VERSION
+        state_ref.set({**state, 'updated_at': firestore.SERVER_TIMESTAMP})
+        return state
     
-    # Calculate risk
-    risk = calculate_risk_features(transactions)
+    if is_applied(state, tx_id):
+        instrumentation.incr('trigger.duplicate_delivery')
+        return state
+
+    location = transaction.get('location')
+    # States written before the index existed carry no marker: the first write seeds the index
+    indexed = state.get('locations_indexed') == LOCATIONS_INDEX_VERSION
+    if location and (not indexed or not any(location in b.get('locations', {}) for b in state['buckets'].values())):
+        # New to the window: index it before the state shows it (see known_locations)
+        record_location(user_id, location)
+        indexed = True
     
-    # Update risk snapshot
-    db.collection('users').document(user_id).collection('risk_snapshots').document('latest').set({
+    new_state, _ = apply_transaction(state, transaction, now, tx_id)
+    if indexed:
+        new_state['locations_indexed'] = LOCATIONS_INDEX_VERSION
+    update = state_update(state, new_state, firestore.Increment, firestore.DELETE_FIELD)
+    with instrumentation.span('firestore.on_transaction_create.state_write'):
+        state_ref.set({**update, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+    return new_state
+
+def write_risk_snapshot(user_id, risk):
+    """Write risk_snapshots/latest and raise an alert if the score is high, in one batch"""
+    db = get_db()
+    writes = WriteBuffer(db)
+    user_ref = db.collection('users').document(user_id)
+    writes.set(user_ref.collection('risk_snapshots').document('latest'), {
         'value': risk['score'],
         'factors': risk['factors'],
         'trend': 'up' if risk['score'] > 50 else 'down',
@@ -80,7 +146,7 @@ def on_transaction_create(event):
     
     # Create alert if high risk
     if risk['score'] > 60:
-        db.collection('users').document(user_id).collection('alerts').add({
+        writes.add(user_ref.collection('alerts'), {
             'title': 'High Financial Risk Detected',
             'message': f"Your risk score is {risk['score']}/100. {', '.join(risk['factors'])}",
             'severity': 'high' if risk['score'] > 75 else 'medium',
@@ -89,4 +155,128 @@ def on_transaction_create(event):
             'timestamp': firestore.SERVER_TIMESTAMP
         })
     
+    with instrumentation.span('firestore.on_transaction_create.snapshot_write'):
+        writes.flush()
+
+def _pending_ref(user_id):
+    return get_db().collection(PENDING_COLLECTION).document(user_id)
+
+def claim_recompute(user_id):
+    """
+    Mark the user's risk as dirty and return True if this trigger should recompute it.
+
+    risk_recompute_pending/{userId} holds a generation counter and the
+    current recomputing trigger's lease. The first trigger of a burst creates
+    it and recomputes; later ones only bump the generation, unless the lease
+    has run out (the recomputing trigger died or handed off) and they take over.
+    """
+    ref = _pending_ref(user_id)
+
+    def claim(transaction):
+        pending = ref.get(transaction=transaction).to_dict()
+        now = datetime.now(timezone.utc)
+        lease = now + timedelta(seconds=COALESCE_LEASE_S)
+        if pending is None:
+            transaction.set(ref, {'generation': 1, 'leader_until': lease})
+            return True
+        if pending['leader_until'] > now:
+            transaction.update(ref, {'generation': pending['generation'] + 1})
+            return False
+        transaction.set(ref, {'generation': pending['generation'] + 1, 'leader_until': lease})
+        return True
+
+    return run_transaction(claim)
+
+def release_recompute(user_id, generation):
+    """
+    Clear the dirty marker unless more transactions arrived since generation.
+
+    Returns False, with the lease renewed, when the caller has to recompute again.
+    """
+    ref = _pending_ref(user_id)
+
+    def release(transaction):
+        pending = ref.get(transaction=transaction).to_dict()
+        if pending is not None and pending['generation'] != generation:
+            lease = datetime.now(timezone.utc) + timedelta(seconds=COALESCE_LEASE_S)
+            transaction.update(ref, {'leader_until': lease})
+            return False
+        transaction.delete(ref)
+        return True
+
+    return run_transaction(release)
+
+def hand_off_recompute(user_id):
+    """Expire the caller's lease, leaving the marker dirty for the next trigger or the sweep."""
+    _pending_ref(user_id).update({'leader_until': datetime.now(timezone.utc)})
+
+def recompute_coalesced(user_id, window_ms=None):
+    """
+    Wait out the burst, rescan once and write the snapshot; repeat while new triggers arrived.
+
+    Every transaction is committed before its trigger bumps the generation.
+    Bumps seen before the rescan are covered by it, and a bump after the
+    generation was read makes release_recompute fail and forces another
+    rescan. After COALESCE_MAX_ROUNDS rescans the marker is handed off
+    still dirty, so a sustained import cannot keep one trigger running into
+    its timeout; whoever picks it up next rescans again, so the final
+    snapshot reflects every transaction.
+    """
+    window_ms = COALESCE_WINDOW_MS if window_ms is None else window_ms
+    for _ in range(max(1, COALESCE_MAX_ROUNDS)):
+        time.sleep(window_ms / 1000)
+        pending = _pending_ref(user_id).get().to_dict() or {}
+        instrumentation.incr('trigger.coalesced_recompute')
+        risk = calculate_risk_from_state(update_rolling_state(user_id, None))
+        write_risk_snapshot(user_id, risk)
+        if release_recompute(user_id, pending.get('generation')):
+            return risk
+    instrumentation.incr('trigger.coalesced_hand_off')
+    hand_off_recompute(user_id)
+    return risk
+
+def sweep_stale_recomputes():
+    """
+    Recompute every user whose dirty marker outlived its lease.
+
+    Covers a recomputing trigger that was killed, or that handed off, with no
+    later trigger for the user to take over. Returns the user ids recomputed.
+    """
+    now = datetime.now(timezone.utc)
+    with instrumentation.span('firestore.on_transaction_create.stale_markers'):
+        stale = [doc.id for doc in get_db().collection(PENDING_COLLECTION)
+                 .where('leader_until', '<=', now).select([]).stream()]
+    recomputed = []
+    for user_id in stale:
+        # Same takeover as a late trigger; skipped if a trigger claimed it meanwhile
+        if claim_recompute(user_id):
+            recompute_coalesced(user_id, window_ms=0)
+            recomputed.append(user_id)
+    return recomputed
+
+@firestore_fn.on_document_created(document="users/{userId}/transactions/{txId}")
+def on_transaction_create(event):
+    user_id = event.params["userId"]
+    transaction = event.data.to_dict() if event.data is not None else None
+    if transaction is not None and RISK_STATE_MODE == 'coalesced':
+        # Incremental mode indexes only locations new to the rolling state, full mode below
+        record_location(user_id, transaction.get('location'))
+    
+    # Calculate risk
+    if RISK_STATE_MODE == 'coalesced':
+        if not claim_recompute(user_id):
+            instrumentation.incr('trigger.coalesced')
+            return f"Coalesced risk update for {user_id}"
+        risk = recompute_coalesced(user_id)
+    elif RISK_STATE_MODE == 'incremental':
+        risk = calculate_risk_from_state(update_rolling_state(user_id, transaction, event.params.get("txId")))
+        write_risk_snapshot(user_id, risk)
+    else:
+        history = load_recent_transactions(user_id)
+        if transaction is not None:
+            record_location(user_id, transaction.get('location'), history)
+        risk = calculate_risk_features(history)
+        write_risk_snapshot(user_id, risk)
+    
+    instrumentation.maybe_emit('on_transaction_create')
     return f"Updated risk for {user_id}: {risk['score']}"
@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+
+# Feature order used by train_risk_model.py and RiskEngine
+FEATURE_NAMES = ['amount', 'time_of_day', 'location_risk', 'merchant_risk', 'frequency']
+
+# Rows evaluated together when walking the trees, bounds the (rows x trees) node matrix
+_ROW_BLOCK = 4096
+
+
+def _flatten_trees(trees):
+    """
+    Concatenates per-tree node arrays into one flat set of arrays.
+
+    Each tree is a dict with 'left', 'right', 'feature', 'threshold', 'value'
+    and 'default_left'. Child indices are rebased to the flat arrays, leaves
+    keep -1 as their left child.
+    """
+    offsets = np.cumsum([0] + [len(t['left']) for t in trees])
+    flat = {key: [] for key in ('left', 'right', 'feature', 'threshold', 'value', 'default_left')}
+    for offset, tree in zip(offsets, trees):
+        left = np.asarray(tree['left'], dtype=np.int64)
+        right = np.asarray(tree['right'], dtype=np.int64)
+        is_leaf = left < 0
+        flat['left'].append(np.where(is_leaf, -1, left + offset))
+        flat['right'].append(np.where(is_leaf, -1, right + offset))
+        flat['feature'].append(np.where(is_leaf, 0, tree['feature']).astype(np.int64))
+        flat['threshold'].append(np.asarray(tree['threshold'], dtype=np.float64))
+        flat['value'].append(np.asarray(tree['value'], dtype=np.float64))
+        flat['default_left'].append(np.asarray(tree['default_left'], dtype=bool))
+    arrays = {key: np.concatenate(values) for key, values in flat.items()}
+    arrays['roots'] = offsets[:-1].astype(np.int64)
+    arrays['max_depth'] = np.int64(max(t['depth'] for t in trees))
+    return arrays
+
+
+def _compile_forest(forest):
+    """Extracts a fitted sklearn RandomForestClassifier as leaf probabilities of the positive class."""
+    trees = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :]
+        proba = value / value.sum(axis=1, keepdims=True)
+        default_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool))
+        trees.append({
+            'left': tree.children_left,
+            'right': tree.children_right,
+            'feature': tree.feature,
+            'threshold': tree.threshold,
+            'value': proba[:, 1],
+            'default_left': default_left,
+            'depth': tree.max_depth
+        })
+    return _flatten_trees(trees)
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _compile_booster(classifier):
+    """Extracts a fitted XGBClassifier (binary:logistic) as leaf margins plus a base margin."""
+    model = json.loads(bytes(classifier.get_booster().save_raw(raw_format='json')))
+    learner = model['learner']
+    trees = []
+    for tree in learner['gradient_booster']['model']['trees']:
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        right = np.asarray(tree['right_children'], dtype=np.int64)
+        # XGBoost sends x < split left; on float32 inputs that is x <= the next float32 below split
+        split = np.asarray(tree['split_conditions'], dtype=np.float32)
+        threshold = np.nextafter(split, np.float32(-np.inf))
+        trees.append({
+            'left': left,
+            'right': right,
+            'feature': tree['split_indices'],
+            'threshold': threshold.astype(np.float64),
+            'value': split.astype(np.float64),
+            'default_left': np.asarray(tree['default_left'], dtype=bool),
+            'depth': _tree_depth(left, right)
+        })
+    arrays = _flatten_trees(trees)
+    base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+    arrays['base_margin'] = np.float64(np.log(base_score / (1 - base_score)))
+    return arrays
+
+
+def _compile_linear(classifier):
+    """Extracts a fitted binary LogisticRegression."""
+    return {
+        'coef': np.asarray(classifier.coef_[0], dtype=np.float64),
+        'intercept': np.float64(classifier.intercept_[0])
+    }
+
+
+def compile_ensemble(model):
+    """
+    Compiles a fitted soft-voting ensemble into flat NumPy arrays.
+
+    Supports the estimators produced by train_risk_model.py: RandomForest,
+    optional XGBoost, and LogisticRegression. Returns a CompiledEnsemble.
+    """
+    weights = model.weights if model.weights is not None else [1] * len(model.estimators_)
+    arrays = {}
+    kinds = []
+    for i, (estimator, weight) in enumerate(zip(model.estimators_, weights)):
+        name = type(estimator).__name__
+        if name == 'RandomForestClassifier':
+            kind, component = 'forest', _compile_forest(estimator)
+        elif name == 'XGBClassifier':
+            kind, component = 'boosted', _compile_booster(estimator)
+        elif name == 'LogisticRegression':
+            kind, component = 'linear', _compile_linear(estimator)
+        else:
+            raise ValueError(f"Unsupported estimator in ensemble: {name}")
+        kinds.append(kind)
+        for key, value in component.items():
+            arrays[f'c{i}_{key}'] = value
+    arrays['kinds'] = np.array(kinds)
+    arrays['weights'] = np.asarray(weights, dtype=np.float64)
+    feature_names = getattr(model, 'feature_names_in_', FEATURE_NAMES)
+    arrays['feature_names'] = np.array(list(feature_names))
+    return CompiledEnsemble(arrays)
+
+
+class CompiledEnsemble:
+    """
+    Soft-voting ensemble evaluated with plain NumPy.
+
+    Produces the same probabilities as the sklearn VotingClassifier it was
+    compiled from, without pandas or sklearn at request time.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.kinds = [str(k) for k in arrays['kinds']]
+        self.weights = arrays['weights']
+        self.feature_names = [str(f) for f in arrays['feature_names']]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def save(self, path):
+        np.savez(path, **self.arrays)
+
+    def _component(self, i):
+        prefix = f'c{i}_'
+        return {key[len(prefix):]: value for key, value in self.arrays.items() if key.startswith(prefix)}
+
+    def _leaf_values(self, tree, X32):
+        """Walks every tree for every row at once and returns the leaf values, shape (rows, trees)."""
+        rows = np.arange(len(X32))[:, None]
+        nodes = np.broadcast_to(tree['roots'], (len(X32), len(tree['roots']))).copy()
+        for _ in range(int(tree['max_depth'])):
+            left = tree['left'][nodes]
+            is_leaf = left < 0
+            if is_leaf.all():
+                break
+            x = X32[rows, tree['feature'][nodes]]
+            go_left = np.where(np.isnan(x), tree['default_left'][nodes], x <= tree['threshold'][nodes])
+            nodes = np.where(is_leaf, nodes, np.where(go_left, left, tree['right'][nodes]))
+        return tree['value'][nodes]
+
+    def _positive_proba(self, X):
+        # Trees compare float32 inputs, as sklearn and XGBoost do internally
+        X32 = X.astype(np.float32).astype(np.float64)
+        probas = []
+        for i, kind in enumerate(self.kinds):
+            component = self._component(i)
+            if kind == 'forest':
+                p = self._leaf_values(component, X32).mean(axis=1)
+            elif kind == 'boosted':
+                margin = component['base_margin'] + self._leaf_values(component, X32).sum(axis=1)
+                p = 1 / (1 + np.exp(-margin))
+            else:
+                p = 1 / (1 + np.exp(-(X @ component['coef'] + component['intercept'])))
+            probas.append(p)
+        return np.average(np.vstack(probas), axis=0, weights=self.weights)
+
+    def predict_proba(self, X):
+        """Returns [[p_legit, p_fraud], ...] for a 2-D array of features in feature_names order."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        p = np.concatenate([self._positive_proba(X[i:i + _ROW_BLOCK]) for i in range(0, len(X), _ROW_BLOCK)]) \
+            if len(X) else np.empty(0)
+        return np.column_stack([1 - p, p])
+
+
+def export_compiled_model(model_path, output_path):
+    """Compiles the joblib ensemble at model_path and writes the arrays to output_path (.npz)."""
+    import joblib
+    compiled = compile_ensemble(joblib.load(model_path))
+    compiled.save(output_path)
+    return compiled
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(__file__)
+    source = os.path.join(here, 'risk_model.joblib')
+    target = os.path.join(here, 'risk_model.npz')
+    export_compiled_model(source, target)
+    print(f"Compiled ensemble written to {target}")
@@ -0,0 +1,205 @@
+"""
+Persistent cache of query embeddings, shared by every worker on the instance.
+
+Embeddings live in one memory-mapped file: a header, an open-addressing
+hash index of 64-bit query hashes with a last-used stamp per slot, and a
+fixed-width float32 vector per slot. All processes map the same file, so a
+query embedded by one worker is a hit for the others, and the cache outlives
+restarts as long as the file does.
+
+Readers take no lock: a vector is copied out and kept only if the slot still
+holds the same key afterwards, and writers clear the key before overwriting a
+vector. Writers serialize on a lock file. A key probes PROBE_SLOTS slots, and
+when they are all taken the least recently used one is evicted.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from src.utils import instrumentation
+from src.utils.startup import lazy_module
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers then only serialize within the process
+    fcntl = None
+
+np = lazy_module('numpy')
+
+EMBED_CACHE_PATH = os.environ.get('RAG_EMBED_CACHE_PATH',
+                                  os.path.join(tempfile.gettempdir(), 'finguard_query_embeddings.bin'))
+
+# Cached queries; the file takes EMBED_CACHE_SIZE * (dim * 4 + 16) bytes
+EMBED_CACHE_SIZE = int(os.environ.get('RAG_EMBED_CACHE_SIZE', '4096'))
+
+# Slots a key may occupy, starting at its hash
+PROBE_SLOTS = 8
+
+_MAGIC = 0x46474543_00000001
+_HEADER = 8  # magic, dim, capacity, model tag, clock, spare
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+class EmbeddingCache:
+    """Query text -> float32 embedding, stored in a memory-mapped file at path."""
+
+    def __init__(self, path=EMBED_CACHE_PATH, capacity=EMBED_CACHE_SIZE, model='default'):
+        self.path = path
+        self.capacity = capacity
+        self.model_tag = _digest(model)
+        self.dim = None
+        self._words = None    # header, keys and stamps (uint64)
+        self._keys = None
+        self._stamps = None
+        self._vectors = None  # (capacity, dim) float32
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _locked_file(self):
+        return _FileLock(self.path + '.lock')
+
+    def _map(self, dim=None):
+        """Maps an existing compatible file, or (given dim) creates a fresh one. Returns False if neither."""
+        if os.path.exists(self.path):
+            words = np.memmap(self.path, dtype=np.uint64, mode='r+', shape=(_HEADER,))
+            header = [int(w) for w in words[:4]]
+            del words
+            if header[0] == _MAGIC and header[2] == self.capacity and header[3] == self.model_tag \
+                    and (dim is None or header[1] == dim):
+                self._attach(header[1])
+                return True
+        if dim is None:
+            return False
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        words = np.memmap(tmp, dtype=np.uint64, mode='w+', shape=(_HEADER + 2 * self.capacity,))
+        words[:4] = [_MAGIC, dim, self.capacity, self.model_tag]
+        words.flush()
+        del words
+        with open(tmp, 'r+b') as f:
+            f.truncate(8 * (_HEADER + 2 * self.capacity) + 4 * dim * self.capacity)
+        os.replace(tmp, self.path)
+        self._attach(dim)
+        return True
+
+    def _attach(self, dim):
+        n_words = _HEADER + 2 * self.capacity
+        # Plain ndarray views of the maps: indexing a np.memmap costs several times more
+        self._words = np.asarray(np.memmap(self.path, dtype=np.uint64, mode='r+', shape=(n_words,)))
+        self._keys = self._words[_HEADER:_HEADER + self.capacity]
+        self._stamps = self._words[_HEADER + self.capacity:]
+        self._vectors = np.asarray(np.memmap(self.path, dtype=np.float32, mode='r+', offset=8 * n_words,
+                                             shape=(self.capacity, dim)))
+        self.dim = dim
+
+    def _slots(self, key):
+        start = key % self.capacity
+        return [(start + i) % self.capacity for i in range(min(PROBE_SLOTS, self.capacity))]
+
+    def _tick(self):
+        # Shared LRU clock; racing increments only blur the eviction order
+        self._words[4] += 1
+        return self._words[4]
+
+    def get(self, text):
+        """The cached embedding of text as a float32 array, or None."""
+        if self._words is None:
+            with self._lock, self._locked_file():
+                if self._words is None and not self._map():
+                    return self._miss()
+        key = _digest(text) or 1
+        keys = self._keys
+        for slot in self._slots(key):
+            if int(keys[slot]) == key:
+                vector = self._vectors[slot].copy()
+                if int(keys[slot]) == key:
+                    self._stamps[slot] = self._tick()
+                    self.hits += 1
+                    instrumentation.incr('rag.embedding_cache_hit')
+                    return vector
+        return self._miss()
+
+    def _miss(self):
+        self.misses += 1
+        instrumentation.incr('rag.embedding_cache_miss')
+        return None
+
+    def put(self, text, vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        key = _digest(text) or 1
+        with self._lock, self._locked_file():
+            if self.dim != len(vector):
+                self._map(len(vector))
+            keys, stamps = self._keys, self._stamps
+            slots = self._slots(key)
+            target = next((s for s in slots if int(keys[s]) == key), None)
+            if target is None:
+                target = next((s for s in slots if keys[s] == 0), None)
+            if target is None:
+                target = min(slots, key=lambda s: stamps[s])
+                self.evictions += 1
+                instrumentation.incr('rag.embedding_cache_eviction')
+            keys[target] = 0
+            self._vectors[target] = vector
+            stamps[target] = self._tick()
+            keys[target] = key
+
+    def clear(self):
+        with self._lock, self._locked_file():
+            if self._words is not None or self._map():
+                self._words[_HEADER:] = 0
+
+    def __len__(self):
+        if self._words is None:
+            return 0
+        return int(np.count_nonzero(self._keys))
+
+    def stats(self):
+        """Returns hit/miss/eviction counters of this process and the shared cache's size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'size': len(self),
+            'capacity': self.capacity
+        }
+
+
+class _FileLock:
+    """Exclusive flock on a side file, held for the duration of a with block."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Returns the process-wide EmbeddingCache at EMBED_CACHE_PATH."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
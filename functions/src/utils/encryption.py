@@ -1,23 +1,49 @@
-from cryptography.fernet import Fernet
 import os
 import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from src.utils import instrumentation
 
 # In production, use a secure key from environment variables (e.g., Google Cloud Secret Manager)
-# For this MVP, we derive a Fernet key from the same passphrase as the frontend, 
+# For this MVP, we derive a Fernet key from the same passphrase as the frontend,
 # but note that improved interoperability would require matching the exact Key Derivation Function parameters.
 SECRET_PASSPHRASE = os.environ.get('NEXT_PUBLIC_ENCRYPTION_KEY', 'dev-secret-key-change-in-prod').encode()
 
-def _get_key(salt=b'salt_for_mvp_only'):
+# Passphrases retired by a key rotation, comma separated. Tokens encrypted under them
+# still decrypt; new tokens always use SECRET_PASSPHRASE.
+PREVIOUS_PASSPHRASES = tuple(
+    p.strip().encode() for p in os.environ.get('ENCRYPTION_PREVIOUS_KEYS', '').split(',') if p.strip()
+)
+
+DEFAULT_SALT = b'salt_for_mvp_only'
+
+# Below this many values the thread pool costs more than it saves
+_PARALLEL_THRESHOLD = 64
+
+@lru_cache(maxsize=16)
+def _derive_key(passphrase, salt):
+    """Runs PBKDF2 once per (passphrase, salt) per process."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    with instrumentation.span('encryption.derive_key'):
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=100000,
+        )
+        return base64.urlsafe_b64encode(kdf.derive(passphrase))
+
+def _get_key(salt=DEFAULT_SALT):
     """Derives a Fernet-compatible key from the passphrase."""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-    )
-    return base64.urlsafe_b64encode(kdf.derive(SECRET_PASSPHRASE))
+    return _derive_key(SECRET_PASSPHRASE, salt)
+
+@lru_cache(maxsize=4)
+def _get_fernet(salt=DEFAULT_SALT):
+    """Reusable MultiFernet: encrypts with the active key, decrypts with any active or previous key."""
+    from cryptography.fernet import Fernet, MultiFernet
+    passphrases = (SECRET_PASSPHRASE,) + PREVIOUS_PASSPHRASES
+    return MultiFernet([Fernet(_derive_key(p, salt)) for p in passphrases])
 
 def encrypt(data: str) -> str:
     """Encrypts a string using Fernet (AES)."""
@@ -25,11 +51,9 @@ def encrypt(data: str) -> str:
         return ""
     try:
         # Use a fixed salt for simplicity in this MVP helper, or generate one and prepend it
-        key = _get_key()
-        f = Fernet(key)
-        return f.encrypt(data.encode()).decode()
+        return _get_fernet().encrypt(data.encode()).decode()
     except Exception as e:
-        print(f"Encryption error: {e}")
+        instrumentation.error('encryption.encrypt', e)
         return ""
 
 def decrypt(token: str) -> str:
@@ -37,9 +61,41 @@ def decrypt(token: str) -> str:
     if not token:
         return ""
     try:
-        key = _get_key()
-        f = Fernet(key)
-        return f.decrypt(token.encode()).decode()
+        return _get_fernet().decrypt(token.encode()).decode()
+    except Exception as e:
+        instrumentation.error('encryption.decrypt', e)
+        return ""
+
+def rotate(token: str) -> str:
+    """Re-encrypts a token produced with a previous key under the active key."""
+    if not token:
+        return ""
+    try:
+        return _get_fernet().rotate(token.encode()).decode()
     except Exception as e:
-        print(f"Decryption error: {e}")
+        instrumentation.error('encryption.rotate', e)
         return ""
+
+def _map(func, values, max_workers):
+    values = list(values)
+    # Extra threads beyond the cores only add switching
+    max_workers = min(max_workers or 1, os.cpu_count() or 1)
+    if max_workers < 2 or len(values) < _PARALLEL_THRESHOLD:
+        return [func(v) for v in values]
+    # Derive the keys before fanning out so workers never race on PBKDF2
+    _get_fernet()
+    # One contiguous slice per worker: Executor.map ignores chunksize for threads, and a
+    # future per value costs more than the cipher work it would hand off
+    step = -(-len(values) // max_workers)
+    slices = [values[start:start + step] for start in range(0, len(values), step)]
+    with ThreadPoolExecutor(max_workers=len(slices)) as pool:
+        results = pool.map(lambda part: [func(v) for v in part], slices)
+        return [out for part in results for out in part]
+
+def encrypt_many(values, max_workers=None):
+    """Encrypts an iterable of strings, optionally over a thread pool. Order is preserved."""
+    return _map(encrypt, values, max_workers)
+
+def decrypt_many(tokens, max_workers=None):
+    """Decrypts an iterable of tokens, optionally over a thread pool. Order is preserved."""
+    return _map(decrypt, tokens, max_workers)
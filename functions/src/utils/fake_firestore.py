@@ -0,0 +1,487 @@
+"""
+In-process stand-in for the Firestore client surface used under functions/src.
+
+Supports collections, documents and subcollections, get/get_all/set/add/
+update/delete, where/order_by/limit/select/stream queries, write batches,
+transactions (see run_transaction), count/sum/avg aggregation queries and
+the SERVER_TIMESTAMP / DELETE_FIELD / Increment sentinels. Every call that
+would be a network round trip sleeps for the configured latency and is
+counted, so handlers can be benchmarked offline. Install it with
+firebase_client.set_db(FakeFirestore()) or FIRESTORE_FAKE=1.
+"""
+import copy
+import operator
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP, Increment
+except ImportError:  # Offline without the Firestore SDK installed
+    class _Sentinel:
+        def __init__(self, description):
+            self.description = description
+
+        def __repr__(self):
+            return f"Sentinel: {self.description}"
+
+    class Increment:
+        def __init__(self, value):
+            self.value = value
+
+    SERVER_TIMESTAMP = _Sentinel("server timestamp")
+    DELETE_FIELD = _Sentinel("delete field")
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+
+_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '>': operator.gt,
+    'in': lambda value, options: value in options,
+    'not-in': lambda value, options: value not in options,
+    'array-contains': lambda value, item: isinstance(value, list) and item in value,
+}
+
+_MISSING = object()
+
+
+def _normalize(value):
+    """Firestore stores naive datetimes as UTC and returns them tz-aware."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _resolve(value, current, now):
+    """Applies a write value to the current field value, resolving sentinels."""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, Increment):
+        base = current if isinstance(current, (int, float)) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        return {k: _resolve(v, _MISSING, now) for k, v in value.items() if v is not DELETE_FIELD}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return _normalize(value)
+
+
+def _merge(target, data, now):
+    """Deep-merges data into target in place, like set(..., merge=True)."""
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value, now)
+        elif isinstance(value, dict):
+            target[key] = {}
+            _merge(target[key], value, now)
+        else:
+            target[key] = _resolve(value, target.get(key, _MISSING), now)
+
+
+def _get_path(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _project(data, field_paths):
+    if field_paths is None:
+        return copy.deepcopy(data)
+    projected = {}
+    for field_path in field_paths:
+        value = _get_path(data, field_path)
+        if value is _MISSING:
+            continue
+        target = projected
+        parts = field_path.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(value)
+    return projected
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_path(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._round_trip(reads=1)
+        return self._client._snapshot(self, field_paths)
+
+    def set(self, data, merge=False):
+        self._client._round_trip(writes=1)
+        self._client._write(self.path, data, merge=merge)
+
+    def create(self, data):
+        self._client._round_trip(writes=1)
+        self._client._write(self.path, data, create=True)
+
+    def update(self, data):
+        self._client._round_trip(writes=1)
+        self._client._update(self.path, data)
+
+    def delete(self):
+        self._client._round_trip(writes=1)
+        self._client._delete(self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class FakeQuery:
+    def __init__(self, client, path, filters=(), orders=(), limit=None, fields=None):
+        self._client = client
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, fields=self._fields)
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path, direction=Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def _matches(self, data):
+        for field_path, op_string, value in self._filters:
+            current = _get_path(data, field_path)
+            if current is _MISSING:
+                return False
+            try:
+                if not _OPERATORS[op_string](current, value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def _results(self):
+        docs = [(doc_id, data) for doc_id, data in self._client._collection(self._path).items() if self._matches(data)]
+        for field_path, direction in reversed(self._orders):
+            docs = [d for d in docs if _get_path(d[1], field_path) is not _MISSING]
+            docs.sort(key=lambda d: _get_path(d[1], field_path), reverse=direction == Query.DESCENDING)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).avg(field_ref, alias)
+
+    def stream(self):
+        with self._client._lock:
+            docs = self._results()
+            snapshots = [
+                FakeDocumentSnapshot(FakeDocumentReference(self._client, f"{self._path}/{doc_id}"),
+                                     _project(data, self._fields))
+                for doc_id, data in docs
+            ]
+        # Firestore bills one read for a query that returns nothing
+        self._client._round_trip(reads=max(1, len(snapshots)))
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+    def __repr__(self):
+        return f"<Aggregation alias={self.alias}, value={self.value}>"
+
+
+class FakeAggregationQuery:
+    """count/sum/avg over a query's matches, computed server side in one round trip."""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field_path, alias):
+        self._aggregations.append((kind, field_path, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, transaction=None):
+        client = self._query._client
+        with client._lock:
+            docs = [data for _, data in self._query._results()]
+        results = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == 'count':
+                value = len(docs)
+            else:
+                values = [v for v in (_get_path(d, field_path) for d in docs)
+                          if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(values)
+                else:
+                    value = sum(values) / len(values) if values else None
+            results.append(AggregationResult(alias, value))
+        # Aggregations bill one read per 1000 index entries matched, at least one
+        client._round_trip(reads=max(1, -(-len(docs) // 1000)))
+        return [results]
+
+    def stream(self, transaction=None):
+        return iter(self.get(transaction))
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(data)
+        return self._client._now(), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference.path, data, merge))
+
+    def create(self, reference, data):
+        self._ops.append(('create', reference.path, data, False))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference.path, data, False))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference.path, None, False))
+
+    def __len__(self):
+        return len(self._ops)
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("Write batch exceeds 500 operations")
+        self._client._round_trip(writes=len(self._ops))
+        for kind, path, data, merge in self._ops:
+            if kind == 'update':
+                self._client._update(path, data)
+            elif kind == 'delete':
+                self._client._delete(path)
+            else:
+                self._client._write(path, data, merge=merge, create=kind == 'create')
+        results = self._ops
+        self._ops = []
+        return results
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Writes buffered by a transaction function; committed when it returns."""
+
+
+class FakeFirestore:
+    """
+    Fake Firestore client.
+
+    Args:
+        latency (float or callable): Seconds slept per round trip, or a
+            zero-argument callable returning them (e.g. random jitter).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._docs = {}  # collection path -> {document id: data}
+        self._update_times = {}
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    # Client surface
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        self._round_trip(reads=len(references))
+        return iter([self._snapshot(ref, field_paths) for ref in references])
+
+    def run_transaction(self, func, *args, **kwargs):
+        """
+        Runs func(transaction, *args, **kwargs) and commits its writes.
+
+        Transactions hold the store lock throughout, so they are serialized
+        against each other and against every other read and write; this is
+        the isolation Firestore gives, without the retries.
+        """
+        with self._lock:
+            transaction = FakeTransaction(self)
+            result = func(transaction, *args, **kwargs)
+            if len(transaction):
+                transaction.commit()
+            return result
+
+    # Instrumentation
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.round_trips = 0
+            self.reads = 0
+            self.writes = 0
+
+    def stats(self):
+        with self._stats_lock:
+            return {'round_trips': self.round_trips, 'reads': self.reads, 'writes': self.writes}
+
+    def _round_trip(self, reads=0, writes=0):
+        with self._stats_lock:
+            self.round_trips += 1
+            self.reads += reads
+            self.writes += writes
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+
+    # Storage
+
+    def _now(self):
+        return datetime.now(timezone.utc)
+
+    def _collection(self, path):
+        return self._docs.get(path, {})
+
+    def _split(self, path):
+        collection_path, doc_id = path.rsplit('/', 1)
+        return collection_path, doc_id
+
+    def _snapshot(self, reference, field_paths=None):
+        with self._lock:
+            collection_path, doc_id = self._split(reference.path)
+            data = self._collection(collection_path).get(doc_id)
+            data = _project(data, field_paths) if data is not None else None
+            return FakeDocumentSnapshot(reference, data, self._update_times.get(reference.path))
+
+    def _write(self, path, data, merge=False, create=False):
+        now = self._now()
+        with self._lock:
+            collection_path, doc_id = self._split(path)
+            docs = self._docs.setdefault(collection_path, {})
+            if create and doc_id in docs:
+                raise ValueError(f"Document already exists: {path}")
+            target = docs.get(doc_id, {}) if merge else {}
+            _merge(target, data, now)
+            docs[doc_id] = target
+            self._update_times[path] = now
+
+    def _update(self, path, data):
+        now = self._now()
+        with self._lock:
+            collection_path, doc_id = self._split(path)
+            docs = self._collection(collection_path)
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {path}")
+            for field_path, value in data.items():
+                parts = field_path.split('.')
+                target = docs[doc_id]
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                _merge(target, {parts[-1]: value}, now)
+            self._update_times[path] = now
+
+    def _delete(self, path):
+        with self._lock:
+            collection_path, doc_id = self._split(path)
+            self._collection(collection_path).pop(doc_id, None)
+            self._update_times.pop(path, None)
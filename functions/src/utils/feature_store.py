@@ -0,0 +1,97 @@
+"""
+Read side of the per-user feature document (see rolling_state).
+
+load_user_features() reads the rolling state and the known-locations index
+in one batched round trip and returns a UserFeatures view that RiskEngine
+accepts wherever it takes a user_history, so a transaction can be scored
+without scanning the user's history.
+"""
+import calendar
+import time
+import numpy as np
+from src.utils.firebase_client import get_db
+from src.utils.known_locations import parse_document
+from src.utils.rolling_state import is_consistent, window_totals
+
+_HOUR = 3600
+
+
+def _hour_start(key):
+    """Epoch seconds at the start of a YYYY-MM-DDTHH key (keys are UTC)."""
+    return calendar.timegm(time.strptime(key, '%Y-%m-%dT%H'))
+
+
+class UserFeatures:
+    """
+    Read-only view over a rolling state document.
+
+    Velocity lookups are answered from the hourly counts, so they are exact
+    to the hour: a transaction in the same hour as the window start is
+    counted even if it is slightly older.
+    """
+
+    def __init__(self, state, known_locations=None):
+        self.state = state
+        # KnownLocations index covering all time; None falls back to the window's locations
+        self.known_locations = known_locations
+        hours = sorted((_hour_start(key), count) for key, count in state.get('hours', {}).items())
+        self._hour_starts = np.array([h for h, _ in hours], dtype=float)
+        # _hour_cum[i] is the number of transactions in the first i hours
+        self._hour_cum = np.concatenate(([0], np.cumsum([c for _, c in hours]))).astype(float)
+        buckets = state.get('buckets', {}).values()
+        self.locations = {loc for b in buckets for loc, n in b.get('locations', {}).items() if n > 0}
+        mix = {}
+        for bucket in buckets:
+            for merchant, count in bucket.get('merchants', {}).items():
+                mix[merchant] = mix.get(merchant, 0) + count
+        self.merchant_counts = {m: n for m, n in mix.items() if n > 0}
+
+    def __len__(self):
+        return self.state.get('tx_count', 0)
+
+    @property
+    def tx_count(self):
+        return self.state.get('tx_count', 0)
+
+    @property
+    def high_risk_count(self):
+        return self.state.get('high_risk_count', 0)
+
+    def count_since(self, start):
+        """Transactions after start (epoch seconds, scalar or array), to hour resolution."""
+        idx = np.searchsorted(self._hour_starts, np.asarray(start, dtype=float) - _HOUR, side='right')
+        counts = self._hour_cum[-1] - self._hour_cum[idx]
+        return int(counts) if np.ndim(counts) == 0 else counts
+
+    def has_location(self, location):
+        """Whether the user transacted from this location (ever with an index, else within the window)."""
+        if self.known_locations is not None:
+            return location in self.known_locations
+        return location in self.locations
+
+    def known_mask(self, locations):
+        """has_location for each of many locations, as a boolean array."""
+        if self.known_locations is not None:
+            return self.known_locations.contains_many(locations)
+        return np.fromiter((loc in self.locations for loc in locations), dtype=bool)
+
+    def merchant_mix(self):
+        """Share of transactions per merchant type."""
+        total = sum(self.merchant_counts.values())
+        return {m: n / total for m, n in self.merchant_counts.items()} if total else {}
+
+    def window_totals(self, now=None):
+        """(total_7d, total_30d) at day resolution."""
+        return window_totals(self.state, now)
+
+
+def load_user_features(user_id):
+    """The user's feature document as UserFeatures, or None if it is missing or stale."""
+    db = get_db()
+    risk_state = db.collection('users').document(user_id).collection('risk_state')
+    docs = {doc.id: doc.to_dict() if doc.exists else None
+            for doc in db.get_all([risk_state.document('rolling'), risk_state.document('locations')])}
+    state = docs.get('rolling')
+    if not is_consistent(state):
+        return None
+    return UserFeatures(state, parse_document(docs.get('locations')))
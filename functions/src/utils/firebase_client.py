@@ -1,10 +1,156 @@
-import firebase_admin
-from firebase_admin import firestore
+import os
+import threading
+import time
+from src.utils import instrumentation
+
+_db = None
 
 def get_db():
     """
-    Returns Firestore client.
+    Returns the Firestore client used by every handler.
+
+    Created on first use. An injected client (see set_db) takes precedence,
+    and FIRESTORE_FAKE=1 selects the in-memory FakeFirestore, with
+    FIRESTORE_FAKE_LATENCY_MS of simulated latency per round trip.
+    """
+    global _db
+    if _db is None:
+        if os.environ.get('FIRESTORE_FAKE') == '1':
+            from src.utils.fake_firestore import FakeFirestore
+            _db = FakeFirestore(latency=float(os.environ.get('FIRESTORE_FAKE_LATENCY_MS', '0')) / 1000)
+        else:
+            import firebase_admin
+            from firebase_admin import firestore
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app()
+            _db = firestore.client()
+    return _db
+
+def run_transaction(func, *args, **kwargs):
+    """
+    Runs func(transaction, *args, **kwargs) in a Firestore transaction and returns its result.
+
+    Reads inside func must pass transaction= and writes go through the
+    transaction object. func may be retried on contention, so it must not
+    have other side effects.
+    """
+    db = get_db()
+    if hasattr(db, 'run_transaction'):  # FakeFirestore
+        return db.run_transaction(func, *args, **kwargs)
+    from firebase_admin import firestore
+    return firestore.transactional(func)(db.transaction(), *args, **kwargs)
+
+def set_db(client):
+    """Injects the Firestore client returned by get_db (None resets to the default)."""
+    global _db
+    _db = client
+
+
+# Firestore rejects batched writes with more operations than this
+MAX_BATCH_WRITES = 500
+
+def _is_transient(exc):
+    """Errors for which the batch was not applied and can safely be retried."""
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(exc, (exceptions.Aborted, exceptions.ServiceUnavailable, exceptions.ResourceExhausted))
+
+class WriteBuffer:
     """
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app()
-    return firestore.client()
+    Accumulates writes and commits them as batched writes of at most 500 operations.
+
+    flush() commits in the calling thread. When max_pending writes are
+    waiting, the next write first flushes, so the buffer stays bounded. A
+    batch that fails with a transient error is retried with exponential
+    backoff. Writes are committed in the order they were buffered.
+
+    Args:
+        db: Firestore client; defaults to get_db() at commit time.
+        max_pending (int): Writes held before a write forces a flush.
+        retries (int): Retries per batch on transient errors.
+        backoff (float): Seconds before the first retry, doubled each time.
+    """
+
+    def __init__(self, db=None, max_pending=5000, retries=3, backoff=0.2):
+        self._db = db
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff = backoff
+        self._pending = []
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    def set(self, reference, data, merge=False):
+        self._enqueue(('set', reference, data, merge))
+
+    def create(self, reference, data):
+        self._enqueue(('create', reference, data, False))
+
+    def update(self, reference, data):
+        self._enqueue(('update', reference, data, False))
+
+    def delete(self, reference):
+        self._enqueue(('delete', reference, None, False))
+
+    def add(self, collection_ref, data):
+        """Buffers the creation of a new auto-id document and returns its reference."""
+        reference = collection_ref.document()
+        self.set(reference, data)
+        return reference
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _enqueue(self, op):
+        with self._lock:
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+        with self._lock:
+            self._pending.append(op)
+
+    def _take(self):
+        with self._lock:
+            ops, self._pending = self._pending, []
+        return ops
+
+    def flush(self):
+        """
+        Commits the buffered writes; returns how many were committed.
+
+        If a batch fails, it and every later write go back to the front of
+        the buffer before the error is raised, so a later flush retries them.
+        """
+        with self._commit_lock:
+            ops = self._take()
+            for start in range(0, len(ops), MAX_BATCH_WRITES):
+                try:
+                    self._commit(ops[start:start + MAX_BATCH_WRITES])
+                except Exception:
+                    with self._lock:
+                        self._pending[:0] = ops[start:]
+                    raise
+        return len(ops)
+
+    def _commit(self, ops):
+        db = self._db or get_db()
+        for attempt in range(self.retries + 1):
+            batch = db.batch()
+            for kind, reference, data, merge in ops:
+                if kind == 'set':
+                    batch.set(reference, data, merge=merge)
+                elif kind == 'delete':
+                    batch.delete(reference)
+                else:
+                    getattr(batch, kind)(reference, data)
+            try:
+                with instrumentation.span('firestore.write_buffer.commit'):
+                    batch.commit()
+                return
+            except Exception as e:
+                if attempt == self.retries or not _is_transient(e):
+                    raise
+                instrumentation.incr('firestore.write_buffer.retries')
+                time.sleep(self.backoff * 2 ** attempt)
@@ -0,0 +1,64 @@
+"""
+Projected loading of a user's recent transactions.
+
+Only the fields risk scoring reads are requested from Firestore (a query
+projection), and each document is decoded into a HistoryRecord with
+__slots__ instead of being kept as a full dict, so encrypted descriptions,
+merchant details and the rest never reach the function's memory.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from src.utils import instrumentation
+from src.utils.firebase_client import get_db
+from src.utils.startup import lazy_module
+
+firestore = lazy_module('firebase_admin.firestore')
+
+# Fields read by risk_features and rolling_state
+HISTORY_FIELDS = ('amount', 'category', 'timestamp', 'location', 'merchant_type')
+
+# Most recent transactions loaded per invocation; older ones inside the
+# window are left out for very heavy users
+HISTORY_MAX_RECORDS = int(os.environ.get('HISTORY_MAX_RECORDS', '20000'))
+
+
+class HistoryRecord:
+    """One projected transaction; supports the dict-style get() the scoring code uses."""
+    __slots__ = HISTORY_FIELDS
+
+    def __init__(self, data):
+        for field in HISTORY_FIELDS:
+            setattr(self, field, data.get(field))
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in HISTORY_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, field):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in HISTORY_FIELDS if getattr(self, field) is not None}
+
+
+def load_history(user_id, days=90, limit=None):
+    """The user's transactions from the last `days` days, newest first, as HistoryRecords."""
+    limit = HISTORY_MAX_RECORDS if limit is None else limit
+    txs_ref = get_db().collection('users').document(user_id).collection('transactions')
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    # Note: Firestore query might require an index for order_by and where
+    query = txs_ref.where('timestamp', '>', cutoff) \
+        .order_by('timestamp', direction=firestore.Query.DESCENDING) \
+        .select(list(HISTORY_FIELDS))
+    if limit:
+        query = query.limit(limit)
+    with instrumentation.span('firestore.history.scan'):
+        records = [HistoryRecord(doc.to_dict()) for doc in query.stream()]
+    instrumentation.incr('history.records', len(records))
+    return records
@@ -0,0 +1,212 @@
+"""
+Lightweight in-process metrics: timing spans, counters and histograms.
+
+Enabled with FINGUARD_METRICS=1 (or enable()). While disabled, span() hands
+back a shared no-op context manager and incr()/observe() return immediately,
+so instrumented hot paths cost a function call and a flag check.
+
+    with span('risk_engine.inference'):
+        ...
+    incr('rag.cache_hit')
+
+    @timed('risk_engine.factor.amount')
+    def _calculate_amount_risk(...): ...
+
+snapshot() returns everything collected; emit() writes it as one structured
+JSON log line, and maybe_emit() does so at most every
+FINGUARD_METRICS_INTERVAL seconds, for calling at the end of a handler.
+log() writes any other diagnostic in the same one-line JSON form.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+_enabled = os.environ.get('FINGUARD_METRICS') == '1'
+EMIT_INTERVAL = float(os.environ.get('FINGUARD_METRICS_INTERVAL', '60'))
+
+# Histogram bucket upper bounds in milliseconds: 1us doubling up to ~18 minutes
+_BOUNDS_MS = [0.001 * 2 ** i for i in range(31)]
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_emit = time.monotonic()
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value_ms):
+        self.buckets[bisect.bisect_left(_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (capped at the observed max)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BOUNDS_MS[i] if i < len(_BOUNDS_MS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 4) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50), 4),
+            'p99_ms': round(self.percentile(99), 4),
+            'max_ms': round(self.max, 4)
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, (time.perf_counter() - self.started) * 1000)
+        if exc_type is not None:
+            incr(f'{self.name}.errors')
+            _mark_counted(exc, self.name)
+        return False
+
+
+def _mark_counted(exc, name):
+    """Remembers on the exception that name.errors already counted it, so error() does not count it again."""
+    try:
+        exc._counted_errors = getattr(exc, '_counted_errors', frozenset()) | {name}
+    except AttributeError:
+        pass
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name):
+    """Context manager timing a block into the histogram called name."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator timing every call of the function into the histogram called name."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def incr(name, value=1):
+    """Adds value to a counter."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value_ms):
+    """Records one duration (milliseconds) into a histogram."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.add(value_ms)
+
+
+def error(name, exc):
+    """
+    Counts a failure and logs it. Failures are logged even while metrics are disabled.
+
+    An exception that already left a span called name was counted there and
+    is only logged.
+    """
+    if name not in getattr(exc, '_counted_errors', ()):
+        incr(f'{name}.errors')
+        _mark_counted(exc, name)
+    log('error', name=name, error=str(exc))
+
+
+def log(event, **fields):
+    """Writes one structured JSON log line, whether or not metrics are enabled."""
+    print(json.dumps({'event': event, **fields}, default=str))
+
+
+def snapshot():
+    """Counters and histogram summaries collected so far."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'histograms': {name: h.summary() for name, h in _histograms.items()}
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def emit(label='metrics'):
+    """Writes the current snapshot as one structured JSON log line."""
+    global _last_emit
+    _last_emit = time.monotonic()
+    log('metrics', label=label, **snapshot())
+
+
+def maybe_emit(label='metrics'):
+    """Emits if enabled and at least EMIT_INTERVAL seconds passed since the last emit."""
+    if _enabled and time.monotonic() - _last_emit >= EMIT_INTERVAL:
+        emit(label)
@@ -0,0 +1,232 @@
+"""
+BM25 keyword retrieval over the FinGuard knowledge base.
+
+The knowledge documents (the ai/rag/knowledge tree that ingest_knowledge.py
+embeds into Chroma) are tokenized offline into an inverted index whose
+postings already carry their BM25 weight. The index is stored next to this
+module as a few .npy arrays plus a small JSON file, and the arrays are
+memory mapped at load, so a query is a handful of dict lookups and slice
+additions followed by a top-k selection.
+
+Rebuild it after editing the knowledge base:
+
+    python -m src.utils.keyword_index
+"""
+import functools
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import threading
+from src.utils import instrumentation
+from src.utils.startup import lazy_module
+
+np = lazy_module('numpy')
+
+INDEX_DIR = os.path.join(os.path.dirname(__file__), "bm25_index")
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "ai", "rag", "knowledge")
+EXTENSIONS = (".md", ".txt")
+
+# Standard BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# ai/rag/ingest_knowledge.py reads and chunks documents with the helpers below,
+# so both retrievers return the same passages
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it my of on or should "
+    "that the their this to what when which will with you your".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ion", "ed", "es", "s", "e")
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    """Strips one common English suffix, keeping at least three characters."""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """Lowercased, stemmed word tokens of text, without stopwords."""
+    return [stem(word) for word in _TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def read_documents(source=KNOWLEDGE_DIR):
+    """{'id', 'text', 'metadata'} for every knowledge file under source, in path order."""
+    paths = []
+    for dirpath, _, filenames in os.walk(source):
+        paths.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(EXTENSIONS))
+    documents = []
+    for path in sorted(paths):
+        relative = os.path.relpath(path, source)
+        doc_id = os.path.splitext(relative)[0].replace(os.sep, "/")
+        with open(path, encoding="utf-8") as f:
+            text = f.read().strip()
+        if text:
+            documents.append({
+                "id": doc_id,
+                "text": text,
+                "metadata": {"category": os.path.dirname(doc_id) or "general",
+                             "topic": os.path.basename(doc_id), "source": relative}
+            })
+    return documents
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Splits text into chunks of chunk_words words, each sharing overlap words with the previous one."""
+    if not 0 <= overlap < chunk_words:
+        raise ValueError(f"overlap must be at least 0 and below chunk_words ({chunk_words}), got {overlap}")
+    words = text.split()
+    if len(words) <= chunk_words:
+        return [" ".join(words)]
+    step = chunk_words - overlap
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, len(words) - overlap, step)]
+
+
+def chunk_documents(documents, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Splits documents into overlapping word chunks with ids '<doc id>#<n>'."""
+    return [{"id": f"{doc['id']}#{n}", "text": part, "metadata": doc["metadata"]}
+            for doc in documents
+            for n, part in enumerate(chunk_text(doc["text"], chunk_words, overlap))]
+
+
+def fingerprint(documents):
+    """Content hash of the indexed documents, used to spot a stale index."""
+    digest = hashlib.blake2b(digest_size=12)
+    for doc in documents:
+        digest.update(f"{doc['id']}\x00{doc['text']}\x00".encode())
+    return digest.hexdigest()
+
+
+class KeywordIndex:
+    """
+    Inverted index with precomputed BM25 weights.
+
+    Postings of term t are doc_ids[offsets[t]:offsets[t + 1]] with matching
+    weights; a query's score for a document is the sum of the weights of its
+    distinct terms. Only the postings slices of the query's terms are read.
+    """
+
+    def __init__(self, terms, offsets, doc_ids, weights, documents, version=None):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        # One entry per term: cheaper to index as a list than as an array
+        self.offsets = offsets.tolist()
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.documents = documents
+        self.version = version
+
+    @classmethod
+    def build(cls, documents, k1=K1, b=B):
+        """Indexes the chunks of documents."""
+        chunks = chunk_documents(documents)
+        # The topic (file name) is indexed with the text: 'privacy.md' answers "privacy"
+        tokenized = [tokenize(chunk["metadata"]["topic"].replace("_", " ") + " " + chunk["text"])
+                     for chunk in chunks]
+        lengths = [len(tokens) for tokens in tokenized]
+        avgdl = sum(lengths) / len(lengths) if lengths else 1.0
+
+        postings = {}
+        for doc, tokens in enumerate(tokenized):
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc, tf))
+
+        n = len(chunks)
+        terms = sorted(postings)
+        offsets, doc_ids, weights = [0], [], []
+        for term in terms:
+            plist = postings[term]
+            idf = math.log((n - len(plist) + 0.5) / (len(plist) + 0.5) + 1)
+            for doc, tf in plist:
+                norm = k1 * (1 - b + b * lengths[doc] / avgdl)
+                doc_ids.append(doc)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets.append(len(doc_ids))
+
+        return cls(terms, np.asarray(offsets, dtype=np.int32), np.asarray(doc_ids, dtype=np.int32),
+                   np.asarray(weights, dtype=np.float32), chunks, fingerprint(documents))
+
+    def save(self, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        np.save(os.path.join(directory, "offsets.npy"), np.asarray(self.offsets, dtype=np.int32))
+        np.save(os.path.join(directory, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(directory, "weights.npy"), self.weights)
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"version": self.version, "terms": terms, "documents": self.documents}, f, indent=0)
+
+    @classmethod
+    def load(cls, directory=INDEX_DIR):
+        """Loads a saved index, memory mapping the postings arrays."""
+        with open(os.path.join(directory, "index.json")) as f:
+            meta = json.load(f)
+        # Plain ndarray views of the maps: slicing a np.memmap costs several times more
+        arrays = [np.asarray(np.load(os.path.join(directory, name), mmap_mode="r"))
+                  for name in ("offsets.npy", "doc_ids.npy", "weights.npy")]
+        return cls(meta["terms"], *arrays, meta["documents"], meta.get("version"))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, text, k=2):
+        """The k best matching chunks as (chunk, score) pairs, best first; chunks sharing no term are left out."""
+        scores = {}
+        for token in dict.fromkeys(tokenize(text)):
+            term = self.term_ids.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            for doc, weight in zip(self.doc_ids[start:end].tolist(), self.weights[start:end].tolist()):
+                scores[doc] = scores.get(doc, 0.0) + weight
+        # Ties go to the earlier chunk
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.documents[doc], score) for doc, score in top]
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """Returns the process-wide KeywordIndex loaded from INDEX_DIR, or None if it cannot be read."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    with instrumentation.span('rag.keyword_index.load'):
+                        _index = KeywordIndex.load()
+                except Exception as e:
+                    instrumentation.error('rag.keyword_index', e)
+                    return None
+    return _index
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    source = argv[0] if argv else KNOWLEDGE_DIR
+    documents = read_documents(source)
+    index = KeywordIndex.build(documents)
+    index.save()
+    print(f"Indexed {len(index)} chunks from {len(documents)} documents "
+          f"({len(index.term_ids)} terms, {len(index.doc_ids)} postings) into {INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    main()
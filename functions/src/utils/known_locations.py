@@ -0,0 +1,135 @@
+"""
+Per-user index of every location a user has transacted from.
+
+The index is a sorted array of 64-bit location hashes, stored as one bytes
+field of users/{userId}/risk_state/locations. A membership test is a binary
+search over the array and needs no history scan. Each distinct location
+costs 8 bytes. A false positive needs a full 64-bit hash collision, which is
+around 1e-10 even with MAX_LOCATIONS entries.
+
+Triggers add locations as transactions are written (record_location). The
+first write for a user seeds the index from their 90-day history. Unlike the
+rolling state, locations never age out of it.
+"""
+import hashlib
+import numpy as np
+from src.utils import instrumentation
+from src.utils.firebase_client import get_db, run_transaction
+from src.utils.history_loader import load_history
+
+# Bump when the stored layout changes; older documents are reseeded from history
+INDEX_VERSION = 1
+
+# Keeps the document well under Firestore's 1 MiB limit; later new locations stay unknown (high risk)
+MAX_LOCATIONS = 100000
+
+
+def location_hash(location):
+    """Signed 64-bit hash of a location name."""
+    return int.from_bytes(hashlib.blake2b(location.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+class KnownLocations:
+    """Sorted, deduplicated location hashes with O(log n) membership tests."""
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+
+    @classmethod
+    def from_locations(cls, locations):
+        hashes = np.fromiter((location_hash(loc) for loc in locations if loc), dtype=np.int64)
+        return cls(np.unique(hashes))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        return cls(np.frombuffer(blob, dtype='<i8'))
+
+    def to_bytes(self):
+        return self.hashes.astype('<i8').tobytes()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, location):
+        if not isinstance(location, str) or not location:
+            return False
+        h = location_hash(location)
+        i = int(np.searchsorted(self.hashes, h))
+        return i < len(self.hashes) and int(self.hashes[i]) == h
+
+    def contains_many(self, locations):
+        """Boolean array: whether each location is known."""
+        locations = list(locations)
+        named = np.fromiter((isinstance(loc, str) and loc != '' for loc in locations), dtype=bool,
+                            count=len(locations))
+        if not len(self.hashes):
+            return np.zeros(len(locations), dtype=bool)
+        hashes = np.fromiter((location_hash(loc) if ok else 0 for loc, ok in zip(locations, named)),
+                             dtype=np.int64, count=len(locations))
+        idx = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return named & (self.hashes[idx] == hashes)
+
+    def add(self, location):
+        """A copy of the index that also contains location."""
+        h = location_hash(location)
+        i = int(np.searchsorted(self.hashes, h))
+        if i < len(self.hashes) and int(self.hashes[i]) == h:
+            return self
+        return KnownLocations(np.insert(self.hashes, i, h))
+
+
+def _locations_ref(user_id):
+    return get_db().collection('users').document(user_id).collection('risk_state').document('locations')
+
+
+def parse_document(data):
+    """KnownLocations from a stored index document, or None if it is missing or outdated."""
+    if not data or data.get('version') != INDEX_VERSION or not isinstance(data.get('hashes'), bytes):
+        return None
+    return KnownLocations.from_bytes(data['hashes'])
+
+
+def load_known_locations(user_id):
+    """The user's KnownLocations (one document read), or None if no index exists yet."""
+    doc = _locations_ref(user_id).get()
+    return parse_document(doc.to_dict() if doc.exists else None)
+
+
+def record_location(user_id, location, history=None):
+    """
+    Adds location to the user's index in a Firestore transaction.
+
+    Costs one read, plus a write only if the location is new. A missing index
+    is seeded from history (the user's recent transactions, loaded with
+    load_history if not given) outside the transaction, so a retried
+    transaction never rescans. Returns True if the index changed.
+    """
+    if not location:
+        return False
+    ref = _locations_ref(user_id)
+    seed = None
+
+    def add(transaction):
+        doc = ref.get(transaction=transaction)
+        index = parse_document(doc.to_dict() if doc.exists else None)
+        if index is None:
+            if seed is None:
+                return None
+            index = seed
+        elif location in index:
+            return False
+        if len(index) >= MAX_LOCATIONS:
+            return False
+        index = index.add(location)
+        transaction.set(ref, {'version': INDEX_VERSION, 'hashes': index.to_bytes(), 'count': len(index)})
+        return True
+
+    with instrumentation.span('firestore.known_locations.record'):
+        changed = run_transaction(add)
+        if changed is None:
+            # No index yet: seed it outside the transaction, then try again
+            if history is None:
+                history = load_history(user_id)
+            seed = KnownLocations.from_locations(t.get('location') for t in history)
+            changed = run_transaction(add)
+        return changed
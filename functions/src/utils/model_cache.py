@@ -0,0 +1,52 @@
+import os
+import threading
+
+from src.utils import instrumentation
+from src.utils.compiled_model import CompiledEnsemble
+from src.utils.startup import lazy_module
+
+joblib = lazy_module('joblib')
+
+# Process-wide cache of loaded models: path -> (mtime, model)
+_cache = {}
+_lock = threading.Lock()
+
+
+def _load(path):
+    instrumentation.incr('model.loads')
+    with instrumentation.span('model.load'):
+        if path.endswith('.npz'):
+            return CompiledEnsemble.load(path)
+        return joblib.load(path)
+
+
+def get_model(path):
+    """
+    Returns the model stored at path, loading it at most once per process.
+
+    The file's mtime is checked on every call, so retraining or re-exporting
+    the model is picked up by warm instances without a restart. Returns None
+    if the file does not exist.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    entry = _cache.get(path)
+    if entry and entry[0] == mtime:
+        return entry[1]
+
+    with _lock:
+        entry = _cache.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        model = _load(path)
+        _cache[path] = (mtime, model)
+        return model
+
+
+def clear_model_cache():
+    """Drops every cached model, forcing the next get_model call to reload."""
+    with _lock:
+        _cache.clear()
@@ -1,54 +1,111 @@
-import chromadb
 import os
+import re
+import threading
+from src.utils import instrumentation
+from src.utils.embedding_cache import get_embedding_cache
+from src.utils.keyword_index import get_keyword_index
+from src.utils.ttl_cache import TTLCache
+
+# Retrieved documents per normalized query
+RAG_CACHE_SIZE = int(os.environ.get('RAG_CACHE_SIZE', '1024'))
+RAG_CACHE_TTL = float(os.environ.get('RAG_CACHE_TTL', '600'))
 
 class RAGService:
     def __init__(self):
         self.persist_directory = os.path.join(os.path.dirname(__file__), "chroma_db")
         self.client = None
         self.collection = None
+        self.embedding_function = None
         self._initialize()
 
     def _initialize(self):
         try:
             import chromadb
+            from chromadb.utils import embedding_functions
             if os.path.exists(self.persist_directory):
+                # The model ingest_knowledge.py embeds with; held here so queries can be embedded once and cached
+                self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
                 self.client = chromadb.PersistentClient(path=self.persist_directory)
-                self.collection = self.client.get_collection(name="finguard_knowledge")
+                self.collection = self.client.get_collection(name="finguard_knowledge",
+                                                             embedding_function=self.embedding_function)
         except Exception as e:
-            print(f"RAG ChromaDB unavailable, using keyword fallback: {e}")
+            instrumentation.error('rag.init', e)
 
     def query(self, text, n_results=2):
         # Keyword-based fallback for showcase if ChromaDB is not ready
         if not self.collection:
-            return self._keyword_search(text)
+            return self._keyword_search(text, n_results)
         
         try:
-            results = self.collection.query(
-                query_texts=[text],
-                n_results=n_results
-            )
+            with instrumentation.span('rag.query'):
+                if self.embedding_function is None:
+                    results = self.collection.query(query_texts=[text], n_results=n_results)
+                else:
+                    results = self.collection.query(query_embeddings=[self.embed(text)], n_results=n_results)
             return results['documents'][0] if results['documents'] else []
         except Exception as e:
-            print(f"RAG Query error: {e}")
-            return self._keyword_search(text)
-
-    def _keyword_search(self, text):
-        """Simulated RAG search for showcase when ChromaDB is unavailable."""
-        text = text.lower()
-        knowledge = {
-            "risk": "FinGuard AI uses a multi-factor Ensemble Risk Engine (XGBoost/RF) with a soft voting mechanism.",
-            "budget": "The 50/30/20 rule suggests: 50% Needs, 30% Wants, 20% Savings/Debt.",
-            "save": "Emergency funds should cover 3-6 months of essential living expenses.",
-            "privacy": "Field-level encryption (AES-256) protects sensitive merchant and description data.",
-            "score": "Scores above 75 require immediate review and enabling 2FA on all linked accounts."
-        }
-        
-        matches = [val for key, val in knowledge.items() if key in text]
-        return matches[:2]
+            instrumentation.error('rag.query', e)
+            return self._keyword_search(text, n_results)
+
+    def embed(self, text):
+        """Embedding of the normalized query, from the shared embedding cache when possible."""
+        key = normalize_query(text)
+        cache = get_embedding_cache()
+        vector = cache.get(key)
+        if vector is None:
+            with instrumentation.span('rag.embed'):
+                vector = self.embedding_function([key])[0]
+            cache.put(key, vector)
+        return [float(x) for x in vector]
+
+    def _keyword_search(self, text, n_results=2):
+        """BM25 search over the precomputed keyword index, used when ChromaDB is unavailable."""
+        index = get_keyword_index()
+        if index is None:
+            return []
+        with instrumentation.span('rag.keyword_search'):
+            return [chunk["text"] for chunk, _ in index.search(text, n_results)]
+
+_service = None
+_service_lock = threading.Lock()
+_query_cache = TTLCache(maxsize=RAG_CACHE_SIZE, ttl=RAG_CACHE_TTL)
+
+def get_rag_service():
+    """Returns the process-wide RAGService, creating it on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RAGService()
+    return _service
+
+def normalize_query(text):
+    """Lowercases and strips punctuation so trivially different phrasings share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def retrieve(message):
+    """Returns the knowledge documents for a message, served from the query cache when possible."""
+    key = normalize_query(message)
+    docs = _query_cache.get(key)
+    if docs is not None:
+        instrumentation.incr('rag.cache_hit')
+        return docs
+    instrumentation.incr('rag.cache_miss')
+    with instrumentation.span('rag.retrieve'):
+        docs = tuple(get_rag_service().query(message))
+    _query_cache.set(key, docs)
+    return docs
+
+def rag_cache_stats():
+    """Hit/miss counters of the retrieval cache."""
+    return _query_cache.stats()
+
+def embedding_cache_stats():
+    """Hit/miss/eviction counters of the query embedding cache."""
+    return get_embedding_cache().stats()
 
 def get_rag_context(message):
-    service = RAGService()
-    context_docs = service.query(message)
+    context_docs = retrieve(message)
     if not context_docs:
         return ""
     
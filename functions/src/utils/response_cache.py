@@ -0,0 +1,52 @@
+"""
+In-process cache of chat answers.
+
+Answers are cached as templates keyed on the normalized message, a
+fingerprint of the retrieved context and a coarse score bucket; the user's
+exact score is filled in per request. The score comes from the user's
+risk_snapshots/latest document, read on every request. Snapshots are
+written by the trigger in other instances, so this read is what invalidates
+per user: as soon as a new snapshot moves a user to another bucket, their
+next question is keyed, and answered, for that bucket.
+"""
+import hashlib
+import os
+from src.utils.ttl_cache import TTLCache
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('CHAT_CACHE_SIZE', '2048'))
+RESPONSE_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', '900'))
+
+# Scores above this get the elevated-risk answer
+ELEVATED_SCORE = 70
+
+_responses = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+
+def score_bucket(score):
+    """The only distinction the answer templates make about a score."""
+    return 'elevated' if score > ELEVATED_SCORE else 'normal'
+
+
+def context_fingerprint(context):
+    return hashlib.blake2b(context.encode(), digest_size=8).hexdigest()
+
+
+def response_key(normalized_message, context, score):
+    return (normalized_message, context_fingerprint(context), score_bucket(score))
+
+
+def get_response(key):
+    return _responses.get(key)
+
+
+def set_response(key, template):
+    _responses.set(key, template)
+
+
+def clear():
+    _responses.clear()
+
+
+def response_cache_stats():
+    """Hit/miss counters of the answer cache."""
+    return {'responses': _responses.stats()}
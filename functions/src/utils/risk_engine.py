@@ -1,7 +1,42 @@
-import joblib
-import pandas as pd
 import numpy as np
 import os
+from src.utils import instrumentation
+from src.utils.compiled_model import CompiledEnsemble
+from src.utils.model_cache import get_model
+from src.utils.risk_levels import LEVEL_BOUNDS, LEVELS, risk_level
+from src.utils.startup import lazy_module
+from src.utils.feature_store import UserFeatures
+from src.utils.user_history import UserHistory, WINDOW_24H
+
+# Only the sklearn fallback model needs pandas
+pd = lazy_module('pandas')
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'risk_model.joblib')
+# NumPy export of the same ensemble, preferred at request time (see compiled_model.py)
+COMPILED_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'risk_model.npz')
+
+# Rows handed to the ensemble per predict_proba call in calculate_risk_scores
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def _batch_length(batch):
+    """Number of rows in a DataFrame or dict of equally sized arrays."""
+    if hasattr(batch, 'index'):
+        return len(batch.index)
+    return len(next(iter(batch.values()))) if batch else 0
+
+
+def _column(batch, name, default, dtype, n):
+    """Reads a column from a DataFrame or dict of arrays, filling missing columns with a default."""
+    if name in batch:
+        values = batch[name]
+        if hasattr(values, 'to_numpy'):
+            values = values.to_numpy()
+        return np.asarray(values, dtype=dtype)
+    if default is None:
+        return None
+    return np.full(n, default, dtype=dtype)
+
 
 class RiskEngine:
     def __init__(self):
@@ -16,17 +51,16 @@ class RiskEngine:
         self.model = self.load_model()
     
     def load_model(self):
-        """Load the trained ensemble risk model."""
+        """Load the trained ensemble risk model from the process-wide cache."""
         try:
-            model_path = os.path.join(os.path.dirname(__file__), 'risk_model.joblib')
-            if os.path.exists(model_path):
-                print(f"Loading risk model from {model_path}")
-                return joblib.load(model_path)
-            else:
-                print("Risk model not found, using rule-based engine only.")
-                return None
+            for model_path in (COMPILED_MODEL_PATH, MODEL_PATH):
+                if os.path.exists(model_path):
+                    return get_model(model_path)
+            instrumentation.incr('risk_engine.model_missing')
+            instrumentation.log('risk_engine.model_missing', detail='using rule-based engine only')
+            return None
         except Exception as e:
-            print(f"Error loading risk model: {e}")
+            instrumentation.error('risk_engine.model_load', e)
             return None
 
     def calculate_risk_score(self, transaction, user_history):
@@ -35,18 +69,23 @@ class RiskEngine:
 
         Args:
             transaction (dict): A dictionary containing transaction details.
-            user_history (list): A list of past transactions for the user.
+            user_history (list, UserHistory or UserFeatures): Past transactions for the
+                user, as a list of dicts, a prebuilt UserHistory index, or the user's
+                feature document (feature_store.load_user_features).
 
         Returns:
             dict: A dictionary containing the risk score, risk level, and factors breakdown.
         """
-        factors = {
-            'amount': self._calculate_amount_risk(transaction),
-            'frequency': self._calculate_frequency_risk(transaction, user_history),
-            'location': self._calculate_location_risk(transaction, user_history),
-            'time': self._calculate_time_risk(transaction),
-            'merchant': self._calculate_merchant_risk(transaction)
-        }
+        instrumentation.incr('risk_engine.scores')
+        with instrumentation.span('risk_engine.features'):
+            recent_count = self._count_recent_transactions(transaction, user_history)
+            factors = {
+                'amount': self._calculate_amount_risk(transaction),
+                'frequency': self._frequency_risk(recent_count),
+                'location': self._calculate_location_risk(transaction, user_history),
+                'time': self._calculate_time_risk(transaction),
+                'merchant': self._calculate_merchant_risk(transaction)
+            }
 
         # Calculate the rule-based risk score
         rule_score = sum(factors[factor] * self.weights[factor] for factor in factors)
@@ -56,20 +95,20 @@ class RiskEngine:
         if self.model:
             try:
                 # Prepare features for the model matching training data
-                features = pd.DataFrame([{
-                    'amount': transaction.get('amount', 0),
-                    'time_of_day': transaction.get('time_of_day', 12),
-                    'location_risk': 1 if factors['location'] > 50 else 0,
-                    'merchant_risk': 1 if factors['merchant'] > 50 else 0,
-                    'frequency': len([t for t in user_history if t['timestamp'] > transaction['timestamp'] - 86400])
-                }])
+                features = {
+                    'amount': [transaction.get('amount', 0)],
+                    'time_of_day': [transaction.get('time_of_day', 12)],
+                    'location_risk': [1 if factors['location'] > 50 else 0],
+                    'merchant_risk': [1 if factors['merchant'] > 50 else 0],
+                    'frequency': [recent_count]
+                }
                 
-                # Predict probability (returns [prob_legit, prob_fraud])
-                fraud_prob = self.model.predict_proba(features)[0][1]
+                # Probability of the fraud class
+                with instrumentation.span('risk_engine.inference'):
+                    fraud_prob = self._predict_fraud_proba(features)[0]
                 model_score = fraud_prob * 100
-                print(f"ML Model Fraud Probability: {fraud_prob:.4f}, Score: {model_score}")
             except Exception as e:
-                print(f"Error in model prediction: {e}")
+                instrumentation.error('risk_engine.inference', e)
                 model_score = rule_score # Fallback
         
         # Combined Score (Weighted Average: 60% Rules, 40% ML)
@@ -78,22 +117,148 @@ class RiskEngine:
         else:
             total_score = rule_score
 
-        # Determine risk level
-        if total_score < 25:
-            risk_level = 'low'
-        elif total_score < 50:
-            risk_level = 'medium'
-        elif total_score < 75:
-            risk_level = 'high'
+        return {
+            'score': total_score,
+            'risk_level': risk_level(total_score),
+            'factors': factors
+        }
+
+    def calculate_risk_scores(self, batch, user_history=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Vectorized counterpart of calculate_risk_score for scoring many transactions at once.
+
+        Args:
+            batch (DataFrame or dict): Columnar transactions. Recognised columns are
+                'amount', 'time_of_day', 'location', 'merchant_type' and 'timestamp';
+                missing columns take the same defaults as the single-row path.
+                History-dependent factors can be supplied per row with 'recent_count'
+                (transactions in the 24h before the row) and 'location_known'
+                (bool), which is how multi-user backfills should call this.
+            user_history (list, UserHistory or UserFeatures, optional): Past transactions shared by
+                every row, used for rows whose 'recent_count' / 'location_known' are
+                not supplied. Counting recent transactions from it needs a 'timestamp'
+                column; without one a ValueError is raised.
+            chunk_size (int): Number of rows passed to the ensemble per predict call.
+
+        Returns:
+            dict: Arrays of 'score' and 'risk_level' plus a 'factors' dict of arrays,
+            matching calculate_risk_score row for row.
+        """
+        n = _batch_length(batch)
+        instrumentation.incr('risk_engine.batch_rows', n)
+        amount = _column(batch, 'amount', 0, float, n)
+        time_of_day = _column(batch, 'time_of_day', 12, float, n)
+        location = _column(batch, 'location', '', object, n)
+        merchant_type = _column(batch, 'merchant_type', '', object, n)
+
+        recent_count = _column(batch, 'recent_count', None, float, n)
+        location_known = _column(batch, 'location_known', None, bool, n)
+        if recent_count is None or location_known is None:
+            history = user_history
+            if not isinstance(history, (UserHistory, UserFeatures)):
+                history = UserHistory.from_transactions(user_history or [])
+            if recent_count is None:
+                timestamps = _column(batch, 'timestamp', None, float, n)
+                if timestamps is None and (isinstance(history, UserFeatures) or len(history)):
+                    raise ValueError("calculate_risk_scores needs a 'timestamp' column to count recent "
+                                     "transactions from user_history (or pass 'recent_count' per row)")
+                if isinstance(history, UserFeatures):
+                    recent_count = history.count_since(timestamps - WINDOW_24H)
+                elif len(history):
+                    cutoff = timestamps - WINDOW_24H
+                    recent_count = len(history) - np.searchsorted(history.timestamps, cutoff, side='right')
+                else:
+                    recent_count = np.zeros(n)
+            if location_known is None:
+                if isinstance(history, UserFeatures):
+                    location_known = history.known_mask(location)
+                else:
+                    user_locations = history.locations
+                    location_known = np.fromiter((loc in user_locations for loc in location), dtype=bool, count=n)
+
+        factors = {
+            'amount': np.select(
+                [amount > 10000, amount > 5000, amount > 1000, amount > 500],
+                [100, 75, 50, 25], 10),
+            'frequency': np.select(
+                [recent_count > 10, recent_count > 5, recent_count > 3, recent_count > 1],
+                [100, 75, 50, 25], 10),
+            'location': np.where(location_known, 10, 100),
+            'time': np.select(
+                [(time_of_day >= 0) & (time_of_day < 6),
+                 (time_of_day >= 6) & (time_of_day < 9),
+                 (time_of_day >= 9) & (time_of_day < 18)],
+                [100, 50, 10], 25),
+            'merchant': self._merchant_risks(merchant_type)
+        }
+
+        # Accumulate in the same order as the single-row sum so scores match bit for bit
+        rule_score = np.zeros(n)
+        for factor in factors:
+            rule_score = rule_score + factors[factor] * self.weights[factor]
+
+        model = self._batch_model()
+        if model:
+            features = {
+                'amount': amount,
+                'time_of_day': time_of_day,
+                'location_risk': (factors['location'] > 50).astype(int),
+                'merchant_risk': (factors['merchant'] > 50).astype(int),
+                'frequency': recent_count
+            }
+            model_score = np.empty(n)
+            for start in range(0, n, chunk_size):
+                stop = start + chunk_size
+                try:
+                    chunk = {name: values[start:stop] for name, values in features.items()}
+                    with instrumentation.span('risk_engine.batch_inference'):
+                        model_score[start:stop] = self._predict_fraud_proba(chunk, model) * 100
+                except Exception as e:
+                    instrumentation.error('risk_engine.batch_inference', e)
+                    model_score[start:stop] = rule_score[start:stop]  # Fallback
+            total_score = (rule_score * 0.6) + (model_score * 0.4)
         else:
-            risk_level = 'critical'
+            total_score = rule_score
+
+        levels = np.select([total_score < bound for bound in LEVEL_BOUNDS], LEVELS[:-1], LEVELS[-1]).astype(object)
 
         return {
             'score': total_score,
-            'risk_level': risk_level,
+            'risk_level': levels,
             'factors': factors
         }
 
+    def _predict_fraud_proba(self, features, model=None):
+        """Fraud probabilities for a dict of equal-length feature columns."""
+        model = model or self.model
+        if isinstance(model, CompiledEnsemble):
+            X = np.column_stack([np.asarray(features[name], dtype=float) for name in model.feature_names])
+            return model.predict_proba(X)[:, 1]
+        return model.predict_proba(pd.DataFrame(features))[:, 1]
+
+    def _batch_model(self):
+        """
+        Model for calculate_risk_scores.
+
+        The compiled export wins on single rows (no pandas, no per-call
+        overhead), but sklearn's native tree code is several times faster on
+        large blocks, so batches use the sklearn ensemble when it is on disk.
+        """
+        if isinstance(self.model, CompiledEnsemble) and os.path.exists(MODEL_PATH):
+            try:
+                return get_model(MODEL_PATH) or self.model
+            except Exception as e:
+                instrumentation.error('risk_engine.model_load', e)
+        return self.model
+
+    def _merchant_risks(self, merchant_types):
+        """Vectorized _calculate_merchant_risk over an array of merchant types."""
+        lowered = np.array([str(m).lower() for m in merchant_types], dtype=object)
+        return np.select(
+            [np.isin(lowered, ['gambling', 'crypto']), np.isin(lowered, ['electronics', 'travel'])],
+            [100, 50], 10)
+
+    @instrumentation.timed('risk_engine.factor.amount')
     def _calculate_amount_risk(self, transaction):
         """Calculate risk based on transaction amount."""
         amount = transaction.get('amount', 0)
@@ -108,28 +273,45 @@ class RiskEngine:
         else:
             return 10
 
+    @instrumentation.timed('risk_engine.factor.frequency')
+    def _count_recent_transactions(self, transaction, user_history):
+        """Count the user's transactions in the 24 hours before this one."""
+        if isinstance(user_history, (UserHistory, UserFeatures)):
+            if not len(user_history):
+                return 0
+            return user_history.count_since(transaction['timestamp'] - WINDOW_24H)
+        return len([t for t in user_history if t['timestamp'] > transaction['timestamp'] - WINDOW_24H])
+
     def _calculate_frequency_risk(self, transaction, user_history):
         """Calculate risk based on transaction frequency."""
-        recent_transactions = [t for t in user_history if t['timestamp'] > transaction['timestamp'] - 86400]  # Last 24 hours
-        if len(recent_transactions) > 10:
+        return self._frequency_risk(self._count_recent_transactions(transaction, user_history))
+
+    def _frequency_risk(self, recent_count):
+        """Map the number of transactions in the last 24 hours to a frequency risk."""
+        if recent_count > 10:
             return 100
-        elif len(recent_transactions) > 5:
+        elif recent_count > 5:
             return 75
-        elif len(recent_transactions) > 3:
+        elif recent_count > 3:
             return 50
-        elif len(recent_transactions) > 1:
+        elif recent_count > 1:
             return 25
         else:
             return 10
 
+    @instrumentation.timed('risk_engine.factor.location')
     def _calculate_location_risk(self, transaction, user_history):
         """Calculate risk based on transaction location."""
         location = transaction.get('location', '')
-        user_locations = {t['location'] for t in user_history}
-        if location not in user_locations:
+        if isinstance(user_history, (UserHistory, UserFeatures)):
+            known = user_history.has_location(location)
+        else:
+            known = location in {t['location'] for t in user_history}
+        if not known:
             return 100
         return 10
 
+    @instrumentation.timed('risk_engine.factor.time')
     def _calculate_time_risk(self, transaction):
         """Calculate risk based on transaction time."""
         time_of_day = transaction.get('time_of_day', 12)  # Assume 24-hour format
@@ -142,6 +324,7 @@ class RiskEngine:
         else:  # Evening
             return 25
 
+    @instrumentation.timed('risk_engine.factor.merchant')
     def _calculate_merchant_risk(self, transaction):
         """Calculate risk based on merchant type."""
         merchant_type = transaction.get('merchant_type', '').lower()
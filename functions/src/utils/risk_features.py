@@ -0,0 +1,79 @@
+"""
+Columnar velocity and category features over a transaction history.
+
+to_columns() converts fetched transaction dicts once into NumPy arrays;
+velocity_features() computes every window total, count and category flag
+from those arrays in one vectorized pass. extract_features() does both and
+is what the trigger scores with, so other handlers computing the same
+features from a history get identical numbers.
+"""
+import numpy as np
+from datetime import datetime, timezone
+from src.utils.rolling_state import HIGH_RISK_CATEGORIES
+
+# Windows (days) reported by velocity_features
+WINDOWS = (7, 30)
+
+
+def to_columns(transactions, now=None):
+    """
+    Converts transaction dicts to columns.
+
+    Returns a dict with 'timestamp' (datetime64[us] in UTC; missing
+    timestamps default to now, naive ones are read as UTC like Firestore does),
+    'amount' (float64), 'category' (int codes into 'categories') and
+    'high_risk' (bool per row).
+    """
+    now = now or datetime.now(timezone.utc)
+    n = len(transactions)
+    # datetime.timestamp() is far cheaper than NumPy's per-object datetime parsing
+    seconds = np.fromiter((_utc_seconds(t.get('timestamp') or now) for t in transactions), dtype=np.float64, count=n)
+    amounts = np.fromiter((t.get('amount', 0) for t in transactions), dtype=np.float64, count=n)
+    names = [t.get('category', 'unknown') for t in transactions]
+    categories = list(dict.fromkeys(names))
+    vocabulary = {category: code for code, category in enumerate(categories)}
+    codes = np.fromiter((vocabulary[name] for name in names), dtype=np.int32, count=n)
+    high_risk_codes = np.array([c in HIGH_RISK_CATEGORIES for c in categories], dtype=bool)
+    return {
+        'timestamp': np.round(seconds * 1e6).astype(np.int64).view('datetime64[us]'),
+        'amount': amounts,
+        'category': codes,
+        'categories': categories,
+        'high_risk': high_risk_codes[codes] if n else np.zeros(0, dtype=bool)
+    }
+
+
+def _utc_seconds(moment):
+    """POSIX seconds of a datetime, reading a naive one as UTC rather than local time."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _as_datetime64(moment):
+    return np.datetime64(round(_utc_seconds(moment) * 1e6), 'us')
+
+
+def velocity_features(columns, now=None):
+    """
+    Window totals and counts plus category counts from to_columns() output.
+
+    A transaction is in the N-day window when its timestamp is strictly
+    later than now minus N days. Returns total_7d, total_30d, count_7d,
+    count_30d, high_risk_count and tx_count.
+    """
+    now = _as_datetime64(now or datetime.now(timezone.utc))
+    timestamps = columns['timestamp']
+    amounts = columns['amount']
+    features = {'tx_count': len(amounts), 'high_risk_count': int(np.count_nonzero(columns['high_risk']))}
+    for days in WINDOWS:
+        in_window = timestamps > now - np.timedelta64(days, 'D')
+        features[f'count_{days}d'] = int(np.count_nonzero(in_window))
+        features[f'total_{days}d'] = float(amounts @ in_window)
+    return features
+
+
+def extract_features(transactions, now=None):
+    """Velocity and category features straight from transaction dicts."""
+    now = now or datetime.now(timezone.utc)
+    return velocity_features(to_columns(transactions, now), now)
@@ -0,0 +1,18 @@
+"""
+Risk level names for 0-100 risk scores.
+
+Shared by RiskEngine and the analyst report so a score gets the same level
+everywhere. Kept free of heavy imports for handlers that only label scores.
+"""
+
+# Upper bounds (exclusive) of every level but the last
+LEVEL_BOUNDS = (25, 50, 75)
+LEVELS = ('low', 'medium', 'high', 'critical')
+
+
+def risk_level(score):
+    """The level of a risk score: low below 25, medium below 50, high below 75, else critical."""
+    for bound, level in zip(LEVEL_BOUNDS, LEVELS):
+        if score < bound:
+            return level
+    return LEVELS[-1]
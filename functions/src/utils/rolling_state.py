@@ -0,0 +1,219 @@
+"""
+Per-user rolling state: the materialized feature document kept at
+users/{userId}/risk_state/rolling and updated on every transaction write.
+
+It holds one bucket per calendar day of the last WINDOW_DAYS days (amount
+sum, count, high-risk count, and per-location and per-merchant-type counts)
+plus hourly counts for the last day. Velocity windows, the known-location
+set, the merchant-type mix and transaction counts are all derived from it,
+so scoring needs this one document instead of a history scan (see
+feature_store.UserFeatures).
+
+Triggers are delivered at least once. The ids of transactions applied in the
+last HOURS_KEPT hours are kept in 'applied', and a redelivered transaction
+is skipped. Two deliveries of one event that run at the same moment can
+still both apply it; the drift lasts until the next rebuild.
+"""
+from datetime import datetime, timedelta
+
+# Bump when the layout of the state document changes; older states are rebuilt by a full rescan
+STATE_VERSION = 2
+
+# History covered by the state, matches the trigger's 90-day query
+WINDOW_DAYS = 90
+
+HIGH_RISK_CATEGORIES = ('cash_advance', 'gambling', 'pawn')
+
+# Hourly counts are kept for this many hours, enough for 24-hour velocity
+HOURS_KEPT = 25
+
+
+def _naive(timestamp, now):
+    """Firestore timestamps are tz-aware UTC; the trigger compares them naive."""
+    if timestamp is None:
+        return now
+    return timestamp.replace(tzinfo=None)
+
+
+def day_key(timestamp):
+    """Bucket key for a timestamp: its calendar day as YYYY-MM-DD."""
+    return timestamp.strftime('%Y-%m-%d')
+
+
+def hour_key(timestamp):
+    """Hourly count key for a timestamp: YYYY-MM-DDTHH."""
+    return timestamp.strftime('%Y-%m-%dT%H')
+
+
+def _expired_keys(buckets, now):
+    oldest = day_key(now - timedelta(days=WINDOW_DAYS))
+    return [key for key in buckets if key <= oldest]
+
+
+def _expired_hours(hours, now):
+    oldest = hour_key(now - timedelta(hours=HOURS_KEPT))
+    return [key for key in hours if key <= oldest]
+
+
+def empty_state():
+    return {
+        'version': STATE_VERSION,
+        'buckets': {},
+        'hours': {},
+        'applied': {},
+        'tx_count': 0,
+        'high_risk_count': 0
+    }
+
+
+def is_applied(state, tx_id):
+    """Whether the transaction tx_id was already folded into state."""
+    return bool(tx_id) and tx_id in (state.get('applied') or {})
+
+
+def mark_applied(state, tx_id, now):
+    """Records tx_id as applied at now (in place), e.g. after a rebuild that included it."""
+    if tx_id:
+        state.setdefault('applied', {})[tx_id] = hour_key(now)
+    return state
+
+
+def merchant_type(transaction):
+    """The merchant type of a transaction, falling back to its category."""
+    return transaction.get('merchant_type') or transaction.get('category') or 'unknown'
+
+
+def bucket_delta(transaction, now):
+    """Returns (day key, bucket increments) contributed by one transaction."""
+    timestamp = _naive(transaction.get('timestamp'), now)
+    high_risk = 1 if transaction.get('category', 'unknown') in HIGH_RISK_CATEGORIES else 0
+    location = transaction.get('location')
+    return day_key(timestamp), {
+        'sum': transaction.get('amount', 0),
+        'count': 1,
+        'high_risk': high_risk,
+        'locations': {location: 1} if location else {},
+        'merchants': {merchant_type(transaction): 1}
+    }
+
+
+def _add(target, delta):
+    for field, value in delta.items():
+        if isinstance(value, dict):
+            _add(target.setdefault(field, {}), value)
+        else:
+            target[field] = target.get(field, 0) + value
+
+
+def _copy(value):
+    return {k: _copy(v) for k, v in value.items()} if isinstance(value, dict) else value
+
+
+def apply_transaction(state, transaction, now=None, tx_id=None):
+    """
+    Folds one new transaction into a rolling state and expires aged-out buckets.
+
+    Returns a new state dict plus the list of bucket keys that were expired,
+    so callers can mirror the change with field deletes. A transaction whose
+    tx_id is already applied leaves the state unchanged.
+    """
+    now = now or datetime.now()
+    if is_applied(state, tx_id):
+        return state, []
+    buckets = _copy(state.get('buckets', {}))
+    hours = dict(state.get('hours', {}))
+    applied = {key: hour for key, hour in (state.get('applied') or {}).items()
+               if hour > hour_key(now - timedelta(hours=HOURS_KEPT))}
+    if tx_id:
+        applied[tx_id] = hour_key(now)
+    key, delta = bucket_delta(transaction, now)
+    _add(buckets.setdefault(key, {}), delta)
+
+    timestamp = _naive(transaction.get('timestamp'), now)
+    if timestamp > now - timedelta(hours=HOURS_KEPT):
+        hour = hour_key(timestamp)
+        hours[hour] = hours.get(hour, 0) + 1
+
+    expired = _expired_keys(buckets, now)
+    for old in expired:
+        del buckets[old]
+    for old in _expired_hours(hours, now):
+        del hours[old]
+
+    return {
+        'version': STATE_VERSION,
+        'buckets': buckets,
+        'hours': hours,
+        'applied': applied,
+        'tx_count': sum(b['count'] for b in buckets.values()),
+        'high_risk_count': sum(b['high_risk'] for b in buckets.values())
+    }, expired
+
+
+def build_state(transactions, now=None):
+    """Builds a rolling state from scratch out of a full history scan."""
+    now = now or datetime.now()
+    state = empty_state()
+    for transaction in transactions:
+        state, _ = apply_transaction(state, transaction, now)
+    return state
+
+
+def is_consistent(state):
+    """Checks the version and that the running totals agree with the buckets."""
+    if not state or state.get('version') != STATE_VERSION:
+        return False
+    buckets = state.get('buckets')
+    if not isinstance(buckets, dict) or not isinstance(state.get('hours'), dict):
+        return False
+    try:
+        return (
+            state.get('tx_count') == sum(b['count'] for b in buckets.values())
+            and state.get('high_risk_count') == sum(b['high_risk'] for b in buckets.values())
+            and all(b['count'] >= 0 and b['high_risk'] >= 0 for b in buckets.values())
+        )
+    except (KeyError, TypeError):
+        return False
+
+
+def window_totals(state, now=None):
+    """
+    Returns (total_7d, total_30d) from the day buckets.
+
+    A window of N days covers today plus the N-1 previous calendar days, so
+    totals are exact to day resolution rather than to the second.
+    """
+    now = now or datetime.now()
+    start_7d = day_key(now - timedelta(days=6))
+    start_30d = day_key(now - timedelta(days=29))
+    total_7d = 0
+    total_30d = 0
+    for key, bucket in state.get('buckets', {}).items():
+        if key >= start_30d:
+            total_30d += bucket['sum']
+            if key >= start_7d:
+                total_7d += bucket['sum']
+    return total_7d, total_30d
+
+
+def state_update(old, new, increment, delete):
+    """
+    Merge-write payload that turns the stored state old into new.
+
+    Changed counters become increment(difference) and keys missing from new
+    become delete, so concurrent writers adding different transactions never
+    overwrite each other. Pass firestore.Increment and firestore.DELETE_FIELD.
+    """
+    update = {key: delete for key in old if key not in new}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict):
+            nested = state_update(previous if isinstance(previous, dict) else {}, value, increment, delete)
+            if nested or not isinstance(previous, dict):
+                update[key] = nested
+        elif value != previous:
+            if isinstance(value, (int, float)) and isinstance(previous, (int, float, type(None))):
+                update[key] = increment(value - (previous or 0))
+            else:
+                update[key] = value
+    return update
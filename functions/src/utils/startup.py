@@ -0,0 +1,73 @@
+"""
+Import timing for cold starts.
+
+timed_import records how long each module took to import; lazy_module
+defers an import until the first attribute access, so handlers only pay for
+the dependencies they actually use. import_report() lists everything
+recorded in milliseconds.
+"""
+import importlib
+import json
+import sys
+import threading
+import time
+
+# module name -> import milliseconds, in load order
+_import_ms = {}
+_lock = threading.Lock()
+
+
+def timed_import(name):
+    """Imports a module, recording the time taken if it was not already loaded."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        _import_ms.setdefault(name, (time.perf_counter() - started) * 1000)
+    return module
+
+
+class _LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = timed_import(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    """Returns a stand-in that imports the module on first attribute access."""
+    return _LazyModule(name)
+
+
+def import_report():
+    """Import milliseconds per recorded module, slowest first."""
+    with _lock:
+        items = sorted(_import_ms.items(), key=lambda item: item[1], reverse=True)
+    return {name: round(ms, 2) for name, ms in items}
+
+
+def log_import_report(label='startup'):
+    """Prints the import report as one structured JSON log line."""
+    report = import_report()
+    print(json.dumps({
+        'event': 'import_report',
+        'label': label,
+        'total_ms': round(sum(report.values()), 2),
+        'modules': report
+    }))
+
+
+if __name__ == "__main__":
+    # main.py logs its own report once every handler module is loaded
+    importlib.import_module('main')
@@ -0,0 +1,100 @@
+import sys
+import os
+import json
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.http.chat_stream import chat_stream, coalesce_frames
+from src.utils.local_harness import use_fake_firestore, stream_http
+
+
+def _events(body):
+    return [json.loads(line[len('data: '):]) for line in body.decode().split('\n\n') if line.startswith('data: ')]
+
+
+def test_chunked_stream_matches_word_stream():
+    db = use_fake_firestore()
+    db.document('users/u1/risk_snapshots/latest').set({'value': 82})
+
+    request = {'userId': 'u1', 'message': 'What is my risk?'}
+    word = stream_http(chat_stream, json={**request, 'streamMode': 'word'})
+    chunked = stream_http(chat_stream, json={**request, 'streamMode': 'chunked'})
+    assert word['status'] == chunked['status'] == 200
+
+    word_events = _events(word['body'])
+    chunked_events = _events(chunked['body'])
+    assert word_events[-1] == chunked_events[-1] == {'done': True}
+    text = ''.join(e['token'] for e in word_events[:-1])
+    assert text == ''.join(e['token'] for e in chunked_events[:-1])
+    assert 'risk score of 82' in text
+
+    # The legacy stream is unchanged: one event per word
+    assert word['body'].startswith(b'data: {"token": "Based "}\n\n')
+    assert len(chunked_events) < len(word_events)
+    assert chunked['bytes'] < word['bytes']
+
+
+def test_coalesce_frames_flushes_by_size_and_time():
+    now = [0.0]
+    tokens = ['a ', 'b ', 'c ', 'd ', 'e ']
+
+    frames = list(coalesce_frames(iter(tokens), max_bytes=4, max_ms=1000, clock=lambda: now[0]))
+    assert frames == [b'data: {"token": "a "}\n\n', b'data: {"token": "b c "}\n\n', b'data: {"token": "d e "}\n\n']
+
+    def slow_tokens():
+        for token in tokens:
+            now[0] += 0.03
+            yield token
+    frames = list(coalesce_frames(slow_tokens(), max_bytes=100, max_ms=50, clock=lambda: now[0]))
+    # 'd ' arrives 60ms after 'b ' opened the second frame
+    assert [json.loads(f[6:])['token'] for f in frames] == ['a ', 'b c d ', 'e ']
+
+
+def test_response_cache_follows_snapshot_changes():
+    from src.utils import response_cache
+
+    response_cache.clear()
+    db = use_fake_firestore()
+    db.document('users/u2/risk_snapshots/latest').set({'value': 42})
+    request = {'userId': 'u2', 'streamMode': 'word'}
+
+    def answer(message):
+        result = stream_http(chat_stream, json={**request, 'message': message})
+        assert result['firestore']['reads'] == 1
+        return ''.join(e.get('token', '') for e in _events(result['body']))
+
+    stats = response_cache.response_cache_stats()['responses']
+    hits, misses = stats['hits'], stats['misses']
+    first = answer('How do I build a budget?')
+    assert answer('how do i build a budget') == first
+    assert response_cache.response_cache_stats()['responses']['hits'] == hits + 1
+
+    # A new snapshot (say, right after a high-risk alert) takes effect on the next question
+    db.document('users/u2/risk_snapshots/latest').set({'value': 85})
+    elevated = answer('how do i build a budget')
+    assert 'risk score of 85' in elevated and 'immediate action' in elevated and 'immediate action' not in first
+    assert response_cache.response_cache_stats()['responses']['misses'] == misses + 2
+
+
+def test_stream_metrics_are_emitted_after_the_last_frame(monkeypatch):
+    from src.utils import instrumentation
+
+    use_fake_firestore()
+    emitted = []
+    monkeypatch.setattr(instrumentation, 'maybe_emit', lambda label: emitted.append(instrumentation.snapshot()))
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        result = stream_http(chat_stream, json={'userId': 'u3', 'message': 'tips for savings',
+                                                'streamMode': 'chunked'})
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    assert len(emitted) == 1
+    histograms = emitted[0]['histograms']
+    assert histograms['chat_stream.ttfb']['count'] == histograms['chat_stream.generate']['count'] == 1
+    assert histograms['chat_stream.ttfb']['max_ms'] <= histograms['chat_stream.generate']['max_ms']
+    assert emitted[0]['counters']['chat_stream.bytes'] == result['bytes']
+    assert 'firestore.chat_stream.risk_snapshot' in histograms
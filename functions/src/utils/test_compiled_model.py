@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.utils.compiled_model import compile_ensemble, CompiledEnsemble, FEATURE_NAMES
+from src.utils.model_cache import get_model, clear_model_cache
+from src.utils.risk_engine import MODEL_PATH
+
+
+def _sample_features(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.exponential(scale=500, size=n) * rng.choice([1, 20], size=n),
+        rng.integers(0, 24, size=n),
+        rng.integers(0, 2, size=n),
+        rng.integers(0, 2, size=n),
+        rng.poisson(lam=3, size=n)
+    ]).astype(float)
+
+
+def test_compiled_predictor_matches_sklearn(tmp_path):
+    model = joblib.load(MODEL_PATH)
+    X = _sample_features(5000)
+
+    expected = model.predict_proba(pd.DataFrame(X, columns=FEATURE_NAMES))
+    compiled = compile_ensemble(model)
+    assert np.abs(compiled.predict_proba(X) - expected).max() < 1e-5
+
+    # Round trip through the exported arrays
+    path = os.path.join(tmp_path, 'risk_model.npz')
+    compiled.save(path)
+    reloaded = CompiledEnsemble.load(path)
+    assert np.abs(reloaded.predict_proba(X) - expected).max() < 1e-5
+
+    print("SUCCESS: Compiled predictor matches the sklearn ensemble.")
+
+
+def test_model_cache_reloads_on_mtime_change(tmp_path):
+    path = os.path.join(tmp_path, 'risk_model.npz')
+    compile_ensemble(joblib.load(MODEL_PATH)).save(path)
+    clear_model_cache()
+
+    first = get_model(path)
+    assert get_model(path) is first
+
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert get_model(path) is not first
+    assert get_model(os.path.join(tmp_path, 'missing.npz')) is None
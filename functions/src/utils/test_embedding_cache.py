@@ -0,0 +1,73 @@
+import sys
+import os
+
+import numpy as np
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils import embedding_cache
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.rag_service import RAGService
+
+
+def test_embeddings_persist_across_instances(tmp_path):
+    path = str(tmp_path / 'embeddings.bin')
+    cache = EmbeddingCache(path, capacity=64)
+    assert cache.get('how do i budget') is None
+
+    cache.put('how do i budget', [0.25, -1.0, 3.5])
+    assert cache.get('how do i budget').tolist() == [0.25, -1.0, 3.5]
+
+    # Another worker (or a restart) maps the same file
+    other = EmbeddingCache(path, capacity=64)
+    assert other.get('how do i budget').dtype == np.float32
+    assert other.get('how do i budget').tolist() == [0.25, -1.0, 3.5]
+    assert other.get('something else') is None
+    assert other.stats() == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3, 'evictions': 0, 'size': 1, 'capacity': 64}
+
+    # A different model or size starts a fresh file
+    assert EmbeddingCache(path, capacity=64, model='other').get('how do i budget') is None
+    resized = EmbeddingCache(path, capacity=32)
+    resized.put('q', [1.0, 2.0])
+    assert len(resized) == 1 and EmbeddingCache(path, capacity=64).get('how do i budget') is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.bin'), capacity=4)
+    for i in range(4):
+        cache.put(f'q{i}', [float(i)])
+    assert cache.get('q0') is not None  # q0 is now the most recently used
+    cache.put('q4', [4.0])
+
+    assert cache.evictions == 1 and len(cache) == 4
+    assert cache.get('q1') is None
+    assert [cache.get(q)[0] for q in ('q0', 'q2', 'q3', 'q4')] == [0.0, 2.0, 3.0, 4.0]
+
+
+class _Collection:
+    def __init__(self):
+        self.calls = []
+
+    def query(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'documents': [['doc']]}
+
+
+def test_rag_query_embeds_each_normalized_query_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, '_cache', EmbeddingCache(str(tmp_path / 'embeddings.bin'), capacity=16))
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [np.full(4, len(texts[0]), dtype=np.float32)]
+
+    service = RAGService.__new__(RAGService)
+    service.collection = _Collection()
+    service.embedding_function = embed
+
+    assert service.query('How do I budget?') == ['doc']
+    assert service.query('how do i budget') == ['doc']
+    assert embedded == ['how do i budget']
+    assert service.collection.calls[1] == {'query_embeddings': [[15.0] * 4], 'n_results': 2}
+    assert embedding_cache.get_embedding_cache().stats()['hits'] == 1
@@ -0,0 +1,36 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils import encryption
+
+
+def test_bulk_round_trip():
+    values = [f"merchant-{i}" for i in range(200)] + [""]
+    tokens = encryption.encrypt_many(values, max_workers=4)
+    assert encryption.decrypt_many(tokens, max_workers=4) == values
+    assert encryption.decrypt_many(tokens[:3]) == values[:3]
+
+
+def test_previous_keys_still_decrypt(monkeypatch):
+    old_token = encryption.encrypt("card ending 4242")
+
+    monkeypatch.setattr(encryption, 'PREVIOUS_PASSPHRASES', (encryption.SECRET_PASSPHRASE,))
+    monkeypatch.setattr(encryption, 'SECRET_PASSPHRASE', b'rotated-passphrase')
+    encryption._get_fernet.cache_clear()
+    try:
+        assert encryption.decrypt(old_token) == "card ending 4242"
+        rotated = encryption.rotate(old_token)
+        assert rotated != old_token
+        assert encryption.decrypt(rotated) == "card ending 4242"
+    finally:
+        encryption._get_fernet.cache_clear()
+
+
+def test_parallel_map_keeps_order_across_slices(monkeypatch):
+    monkeypatch.setattr(encryption.os, 'cpu_count', lambda: 3)
+    values = list(range(100))
+    assert encryption._map(lambda v: v * 2, values, max_workers=3) == [v * 2 for v in values]
+    assert encryption._map(str, values, max_workers=8) == [str(v) for v in values]
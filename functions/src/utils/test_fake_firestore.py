@@ -0,0 +1,158 @@
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.fake_firestore import FakeFirestore, Increment, DELETE_FIELD, SERVER_TIMESTAMP, Query
+from src.utils.local_harness import use_fake_firestore, call_http, fire_document_created, run_scheduled
+
+
+def test_documents_queries_and_counters():
+    db = FakeFirestore()
+    txs = db.collection('users').document('u1').collection('transactions')
+    now = datetime.now()
+    for i in range(5):
+        txs.add({'amount': i, 'timestamp': now - timedelta(days=i)})
+
+    recent = txs.where('timestamp', '>', now - timedelta(days=2, hours=1)) \
+        .order_by('timestamp', direction=Query.DESCENDING).stream()
+    assert [t.to_dict()['amount'] for t in recent] == [0, 1, 2]
+
+    ref = db.document('users/u1/risk_state/rolling')
+    ref.set({'buckets': {'a': {'count': Increment(2)}}, 'updated_at': SERVER_TIMESTAMP})
+    ref.set({'buckets': {'a': {'count': Increment(1)}, 'b': {'count': 1}}}, merge=True)
+    ref.set({'buckets': {'b': DELETE_FIELD}}, merge=True)
+    state = ref.get().to_dict()
+    assert state['buckets'] == {'a': {'count': 3}}
+    assert isinstance(state['updated_at'], datetime)
+
+    batch = db.batch()
+    for i in range(3):
+        batch.set(db.collection('metrics').document(f'm{i}'), {'value': i})
+    batch.commit()
+    snapshots = list(db.get_all([db.document(f'metrics/m{i}') for i in range(4)], field_paths=['value']))
+    assert [s.exists for s in snapshots] == [True, True, True, False]
+
+    assert db.stats() == {'round_trips': 12, 'reads': 8, 'writes': 11}
+
+
+def test_handlers_run_offline():
+    from src.triggers.on_transaction_create import on_transaction_create
+    from src.http.batch_analyze import batch_analyze
+    from src.scheduled.aggregate_metrics import aggregate_metrics
+
+    db = use_fake_firestore()
+    now = datetime.now()
+    for i in range(6):
+        tx = {'amount': -1000, 'category': 'gambling' if i == 0 else 'groceries', 'timestamp': now - timedelta(days=i)}
+        result = fire_document_created(on_transaction_create, {'userId': 'u1', 'txId': f't{i}'}, tx,
+                                       document_path=f'users/u1/transactions/t{i}')
+    assert result['firestore']['reads'] == 1  # incremental mode reads only the rolling state
+    snapshot = db.document('users/u1/risk_snapshots/latest').get().to_dict()
+    assert snapshot['value'] == 55 and 'high_risk_transactions' in snapshot['factors']
+
+    csv_text = "client_id,income,expenses,debt\nc1,100,90,10\nc2,100,10,400\n"
+    response = call_http(batch_analyze, json={'analystId': 'a1', 'csv': csv_text, 'stream': True})
+    lines = [json.loads(line) for line in response['body'].decode().splitlines()]
+    assert [line.get('risk_score') for line in lines[:2]] == [60, 55]
+    assert lines[-1]['done'] and lines[-1]['total_clients'] == 2
+
+    db.document('institutions/i1').set({'name': 'Bank'})
+    db.document('institutions/i1/users/u1').set({})
+    run_scheduled(aggregate_metrics)
+    assert db.document('institutions/i1/metrics/realtime').get().to_dict()['average_risk'] == 55
+
+
+def test_redelivered_trigger_is_not_counted_twice():
+    from src.triggers.on_transaction_create import on_transaction_create
+
+    db = use_fake_firestore()
+    tx = {'amount': -300, 'category': 'groceries', 'timestamp': datetime.now()}
+    for _ in range(3):
+        fire_document_created(on_transaction_create, {'userId': 'r1', 'txId': 't1'}, tx,
+                              document_path='users/r1/transactions/t1')
+    fire_document_created(on_transaction_create, {'userId': 'r1', 'txId': 't2'}, tx,
+                          document_path='users/r1/transactions/t2')
+    state = db.document('users/r1/risk_state/rolling').get().to_dict()
+    assert state['tx_count'] == 2 and sorted(state['applied']) == ['t1', 't2']
+
+
+def test_coalesced_burst_recomputes_once():
+    from concurrent.futures import ThreadPoolExecutor
+    from src.triggers import on_transaction_create as trigger
+
+    db = use_fake_firestore(latency=0.001)
+    mode, window = trigger.RISK_STATE_MODE, trigger.COALESCE_WINDOW_MS
+    trigger.RISK_STATE_MODE, trigger.COALESCE_WINDOW_MS = 'coalesced', 50
+    now = datetime.now()
+    try:
+        def insert(i):
+            tx = {'amount': -500 - i, 'category': 'gambling' if i % 5 == 0 else 'groceries',
+                  'timestamp': now - timedelta(hours=i)}
+            return fire_document_created(trigger.on_transaction_create, {'userId': 'u9', 'txId': f't{i}'}, tx,
+                                         document_path=f'users/u9/transactions/t{i}')['result']
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(insert, range(40)))
+    finally:
+        trigger.RISK_STATE_MODE, trigger.COALESCE_WINDOW_MS = mode, window
+
+    updates = [r for r in results if r.startswith('Updated')]
+    assert 1 <= len(updates) < 5
+    assert not db.document('risk_recompute_pending/u9').get().exists
+    expected = trigger.calculate_risk_features(trigger.load_recent_transactions('u9'))
+    snapshot = db.document('users/u9/risk_snapshots/latest').get().to_dict()
+    assert snapshot['value'] == expected['score'] and snapshot['total_30d'] == expected['total_30d']
+
+
+def test_stale_coalesced_marker_is_handed_off_and_swept(monkeypatch):
+    from datetime import timezone
+    from src.triggers import on_transaction_create as trigger
+    from src.scheduled.sweep_risk_recomputes import sweep_risk_recomputes
+
+    db = use_fake_firestore()
+    now = datetime.now()
+    for i in range(3):
+        db.document(f'users/u7/transactions/t{i}').set(
+            {'amount': -100, 'category': 'gambling', 'timestamp': now - timedelta(days=i)})
+
+    # A trigger arrives during every rescan: the leader stops after its last round
+    write_snapshot = trigger.write_risk_snapshot
+
+    def write_during_burst(user_id, risk):
+        write_snapshot(user_id, risk)
+        assert not trigger.claim_recompute(user_id)
+    monkeypatch.setattr(trigger, 'write_risk_snapshot', write_during_burst)
+    monkeypatch.setattr(trigger, 'COALESCE_MAX_ROUNDS', 2)
+    assert trigger.claim_recompute('u7')
+    trigger.recompute_coalesced('u7', window_ms=0)
+    marker = db.document('risk_recompute_pending/u7').get().to_dict()
+    assert marker['generation'] == 3 and marker['leader_until'] <= datetime.now(timezone.utc)
+    monkeypatch.undo()
+
+    # The sweep finishes u7; a marker still inside its lease is left to its leader
+    db.document('risk_recompute_pending/u8').set(
+        {'generation': 4, 'leader_until': datetime.now(timezone.utc) + timedelta(seconds=30)})
+    result = run_scheduled(sweep_risk_recomputes)
+    assert result['result'] == 'Recomputed risk for 1 users'
+    assert not db.document('risk_recompute_pending/u7').get().exists
+    assert db.document('risk_recompute_pending/u8').get().exists  # still leased
+    expected = trigger.calculate_risk_features(trigger.load_recent_transactions('u7'))
+    assert db.document('users/u7/risk_snapshots/latest').get().to_dict()['value'] == expected['score']
+
+
+def test_batch_analyze_stream_matches_legacy():
+    from src.http.batch_analyze import batch_analyze
+
+    use_fake_firestore()
+    csv_text = ("client_id,income,expenses,debt\nc1,100,90,0\n\nc2,100,10,400\n"
+                "c3,abc,10,10\nc4,100\n,50,45,0\n\n\n")
+    legacy = json.loads(call_http(batch_analyze, json={'analystId': 'a1', 'csv': csv_text})['body'])['results']
+    response = call_http(batch_analyze, json={'analystId': 'a1', 'csv': csv_text, 'stream': True})
+    streamed = [json.loads(line) for line in response['body'].decode().splitlines()][:-1]
+
+    assert len(legacy) == 5
+    assert [(r['client_id'], r['risk_score']) for r in streamed] == \
+        [(r['client_id'], r['risk_score']) for r in legacy]
@@ -0,0 +1,71 @@
+import sys
+import os
+import calendar
+from datetime import datetime, timedelta
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import numpy as np
+
+from src.utils.feature_store import UserFeatures, load_user_features
+from src.utils.local_harness import use_fake_firestore, fire_document_created
+from src.utils.risk_engine import RiskEngine
+from src.utils.rolling_state import build_state
+
+
+def _epoch(moment):
+    return calendar.timegm(moment.timetuple())
+
+
+def _history(now):
+    locations = ['Pune', 'Delhi', 'Mumbai']
+    merchants = ['groceries', 'electronics', 'travel']
+    history = [{'amount': 100 + k, 'timestamp': now - timedelta(hours=k + 0.5),
+                'location': locations[k % 3], 'merchant_type': merchants[k % 2]} for k in range(30)]
+    history += [{'amount': 900, 'timestamp': now - timedelta(days=d), 'location': 'Goa',
+                 'merchant_type': 'travel'} for d in range(3, 40, 6)]
+    return history
+
+
+def test_features_score_like_the_full_history():
+    now = datetime(2026, 10, 18, 12, 0)
+    history = _history(now)
+    features = UserFeatures(build_state(history, now))
+    as_list = [{**t, 'timestamp': _epoch(t['timestamp'])} for t in history]
+
+    assert features.count_since(_epoch(now) - 86400) == 24
+    assert features.locations == {'Pune', 'Delhi', 'Mumbai', 'Goa'}
+    assert abs(sum(features.merchant_mix().values()) - 1) < 1e-9
+    assert features.merchant_counts['travel'] == len(history) - 30
+
+    engine = RiskEngine()
+    for location in ('Pune', 'Paris'):
+        tx = {'amount': 6000, 'timestamp': _epoch(now), 'location': location,
+              'merchant_type': 'electronics', 'time_of_day': 12}
+        assert engine.calculate_risk_score(tx, features) == engine.calculate_risk_score(tx, as_list)
+
+    batch = {'amount': np.array([50.0, 6000.0]), 'timestamp': np.array([_epoch(now)] * 2, dtype=float),
+             'location': np.array(['Goa', 'Paris'], dtype=object)}
+    by_features = engine.calculate_risk_scores(batch, features)
+    by_list = engine.calculate_risk_scores(batch, as_list)
+    assert np.array_equal(by_features['score'], by_list['score'])
+
+
+def test_feature_document_maintained_by_trigger():
+    from src.triggers.on_transaction_create import on_transaction_create
+
+    use_fake_firestore()
+    now = datetime.now()
+    for i in range(4):
+        tx = {'amount': -200, 'category': 'groceries', 'location': 'Pune' if i else 'Delhi',
+              'timestamp': now - timedelta(hours=i)}
+        fire_document_created(on_transaction_create, {'userId': 'f1', 'txId': f't{i}'}, tx,
+                              document_path=f'users/f1/transactions/t{i}')
+
+    features = load_user_features('f1')
+    assert features.tx_count == 4
+    assert features.locations == {'Pune', 'Delhi'}
+    assert features.merchant_mix() == {'groceries': 1.0}
+    assert features.count_since(now.timestamp() - 86400) == 4
+    assert load_user_features('nobody') is None
@@ -0,0 +1,105 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from google.api_core import exceptions
+
+from src.utils.fake_firestore import FakeFirestore
+from src.utils.firebase_client import WriteBuffer
+
+
+class FlakyFirestore(FakeFirestore):
+    """Fails the next batch commits with the given errors."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def flaky_commit():
+            if self.failures:
+                raise self.failures.pop()
+            return commit()
+        batch.commit = flaky_commit
+        return batch
+
+
+def test_write_buffer_batches_in_order():
+    db = FakeFirestore()
+    writes = WriteBuffer(db)
+    docs = db.collection('docs')
+    for i in range(1200):
+        writes.set(docs.document(f'd{i}'), {'n': i})
+    writes.update(docs.document('d0'), {'n': -1})
+    assert len(writes) == 1201 and db.stats()['writes'] == 0
+
+    assert writes.flush() == 1201
+    assert db.stats() == {'round_trips': 3, 'reads': 0, 'writes': 1201}
+    assert db.document('docs/d0').get().to_dict() == {'n': -1}
+    assert len(writes) == 0
+
+
+def test_write_buffer_bounded_and_retry():
+    db = FakeFirestore()
+    writes = WriteBuffer(db, max_pending=10, backoff=0)
+    for i in range(25):
+        writes.add(db.collection('alerts'), {'n': i})
+    # Reaching max_pending forced two synchronous flushes
+    assert len(writes) == 5 and db.stats()['round_trips'] == 2
+
+    writes.flush()
+    assert len(db.collection('alerts').get()) == 25
+
+    flaky = FlakyFirestore([exceptions.ServiceUnavailable('try again'), exceptions.Aborted('contention')])
+    writes = WriteBuffer(flaky, backoff=0)
+    writes.set(flaky.document('docs/x'), {'ok': True})
+    writes.flush()
+    assert flaky.document('docs/x').get().to_dict() == {'ok': True}
+    assert not flaky.failures
+
+
+class FailingFirestore(FakeFirestore):
+    """Fails the nth batch commit (counting from 1) once."""
+
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+        self.commits = 0
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def failing_commit():
+            self.commits += 1
+            if self.commits == self.fail_on:
+                raise exceptions.PermissionDenied('denied')
+            return commit()
+        batch.commit = failing_commit
+        return batch
+
+
+def test_failed_batch_keeps_its_writes_and_later_ones():
+    db = FailingFirestore(fail_on=2)
+    writes = WriteBuffer(db, backoff=0)
+    docs = db.collection('docs')
+    for i in range(1200):
+        writes.set(docs.document(f'd{i}'), {'n': i})
+
+    try:
+        writes.flush()
+        raise AssertionError('flush should have raised')
+    except exceptions.PermissionDenied:
+        pass
+    # The first batch landed; the failed second and the unsent third are still buffered
+    assert db.stats()['writes'] == 500 and len(writes) == 700
+    writes.set(docs.document('d1200'), {'n': 1200})
+
+    assert writes.flush() == 701
+    assert len(writes) == 0
+    assert sorted(doc.to_dict()['n'] for doc in docs.get()) == list(range(1201))
@@ -0,0 +1,70 @@
+import sys
+import os
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.http.generate_report import generate_report
+from src.utils.local_harness import use_fake_firestore, call_http
+
+
+def _seed(db, n_clients=12):
+    now = datetime.now()
+    for i in range(n_clients):
+        cid = f'c{i}'
+        db.document(f'analysts/a1/client_links/link{i}').set({'clientId': cid})
+        db.document(f'users/{cid}/risk_snapshots/latest').set({
+            'value': 30 + i * 5, 'trend': 'up' if i % 3 == 0 else 'down',
+            'factors': ['high_risk_transactions'] if i > 8 else ['stable_pattern']})
+        for k in range(i):
+            db.document(f'users/{cid}/transactions/t{k}').set(
+                {'amount': -100.0, 'timestamp': now - timedelta(days=k * 4), 'description_enc': 'x'})
+
+
+def test_report_is_computed_from_data_and_cached():
+    db = use_fake_firestore()
+    _seed(db)
+    request = {'analystId': 'a1', 'templateId': 'monthly'}
+
+    first = call_http(generate_report, json=request)
+    report = json.loads(first['body'])['report']
+    stats = report['statistics']
+    assert stats['total_clients'] == 12
+    assert stats['average_risk'] == sum(30 + i * 5 for i in range(12)) / 12
+    # Same levels as RiskEngine: below 25 low, below 50 medium, below 75 high
+    assert stats['risk_levels'] == {'low': 0, 'medium': 4, 'high': 5, 'critical': 3}
+    # Transactions inside the 30-day window: k * 4 < 30, i.e. k <= 7
+    assert stats['transactions_30d'] == sum(min(i, 8) for i in range(12))
+    assert report['top_clients'][0]['client_id'] == 'c11'
+
+    # Same data: served from the cache, with no aggregation queries
+    second = call_http(generate_report, json=request)
+    assert json.loads(second['body'])['report']['data_version'] == report['data_version']
+    assert second['firestore']['round_trips'] < first['firestore']['round_trips']
+
+    # A rewritten snapshot changes the data version
+    db.document('users/c0/risk_snapshots/latest').set({'value': 95, 'trend': 'up', 'factors': []})
+    third = json.loads(call_http(generate_report, json=request)['body'])['report']
+    assert third['data_version'] != report['data_version']
+    assert third['statistics']['risk_levels']['critical'] == 4
+
+
+def test_full_report_streams_as_csv_and_ndjson():
+    db = use_fake_firestore()
+    _seed(db, n_clients=5)
+    request = {'analystId': 'a1', 'templateId': 'full'}
+
+    response = call_http(generate_report, json={**request, 'format': 'csv'})
+    rows = list(csv.DictReader(io.StringIO(response['body'].decode())))
+    assert response['headers']['Content-Type'].startswith('text/csv')
+    assert [row['client_id'] for row in rows] == ['c4', 'c3', 'c2', 'c1', 'c0']
+    assert rows[0]['tx_count_30d'] == '4'
+
+    response = call_http(generate_report, json={**request, 'format': 'ndjson'})
+    lines = [json.loads(line) for line in response['body'].decode().splitlines()]
+    assert lines[0]['report']['statistics']['total_clients'] == 5
+    assert len(lines) == 6
@@ -0,0 +1,38 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.history_loader import HistoryRecord, load_history
+from src.utils.local_harness import use_fake_firestore
+from src.utils.risk_features import extract_features
+from src.utils.rolling_state import build_state
+
+
+def test_projected_history_matches_full_documents():
+    db = use_fake_firestore()
+    # Naive timestamps are UTC, as Firestore stores them
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    txs = db.collection('users').document('h1').collection('transactions')
+    full = []
+    for i in range(60):
+        doc = {'amount': -10.0 * i, 'category': 'gambling' if i % 7 == 0 else 'groceries',
+               'timestamp': now - timedelta(days=i * 2, minutes=1), 'location': 'Pune',
+               'description_enc': 'x' * 500, 'merchant': {'name': 'Shop', 'mcc': '5411'}}
+        txs.add(doc)
+        full.append(doc)
+
+    records = load_history('h1')
+    assert len(records) == 45  # inside the 90-day window
+    assert all(isinstance(r, HistoryRecord) for r in records)
+    assert records[0].to_dict().keys() == {'amount', 'category', 'timestamp', 'location'}
+    assert records[0].get('merchant_type', 'none') == 'none' and 'description_enc' not in records[0]
+
+    in_window = [t for t in full if t['timestamp'] > now - timedelta(days=90)]
+    assert extract_features(records, now) == extract_features(in_window, now)
+    assert build_state(records, now) == build_state(in_window, now)
+
+    newest = load_history('h1', limit=5)
+    assert [r['amount'] for r in newest] == [0.0, -10.0, -20.0, -30.0, -40.0]
@@ -0,0 +1,71 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils import instrumentation
+from src.utils.risk_engine import RiskEngine
+
+
+def test_disabled_collects_nothing():
+    instrumentation.disable()
+    instrumentation.reset()
+    with instrumentation.span('noop'):
+        pass
+    instrumentation.incr('noop')
+    assert instrumentation.snapshot() == {'counters': {}, 'histograms': {}}
+
+
+def test_spans_counters_and_engine_factors():
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        for ms in (1.0, 2.0, 3.0, 100.0):
+            instrumentation.observe('manual', ms)
+        try:
+            with instrumentation.span('failing'):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+
+        engine = RiskEngine()
+        engine.calculate_risk_score(
+            {'amount': 500, 'timestamp': 1000, 'location': 'NY', 'merchant_type': 'retail'},
+            [{'timestamp': 900, 'location': 'NY'}]
+        )
+        snap = instrumentation.snapshot()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    manual = snap['histograms']['manual']
+    assert manual['count'] == 4 and manual['max_ms'] == 100.0
+    assert manual['p50_ms'] <= manual['p99_ms'] <= 100.0
+    assert snap['counters']['failing.errors'] == 1
+    assert snap['counters']['risk_engine.scores'] == 1
+    for factor in ('amount', 'frequency', 'location', 'time', 'merchant'):
+        assert snap['histograms'][f'risk_engine.factor.{factor}']['count'] == 1
+    assert 'risk_engine.features' in snap['histograms']
+
+
+def test_error_inside_span_is_counted_once(capsys):
+    class BrokenModel:
+        def predict_proba(self, X):
+            raise ValueError('bad model')
+
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        engine = RiskEngine()
+        engine.model = BrokenModel()
+        engine.calculate_risk_score({'amount': 500, 'timestamp': 1000, 'location': 'NY'}, [])
+        instrumentation.error('standalone', RuntimeError('once'))
+        snap = instrumentation.snapshot()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    assert snap['counters']['risk_engine.inference.errors'] == 1
+    assert snap['counters']['standalone.errors'] == 1
+    assert '"name": "risk_engine.inference", "error": "bad model"' in capsys.readouterr().out
@@ -0,0 +1,67 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.keyword_index import KeywordIndex, fingerprint, get_keyword_index, read_documents, tokenize
+from src.utils.rag_service import RAGService
+
+# Labelled queries: the knowledge document each one should retrieve first
+LABELLED_QUERIES = [
+    ("How do I save money?", "advice/savings"),
+    ("How big should my emergency fund be?", "advice/savings"),
+    ("What's the 50/30/20 budgeting rule?", "advice/budgeting"),
+    ("How much of my income should go to wants?", "advice/budgeting"),
+    ("My risk score is high, what should I do?", "advice/high_risk"),
+    ("Should I enable two-factor authentication?", "advice/high_risk"),
+    ("How does the risk engine work?", "technical/risk_engine"),
+    ("Do you use XGBoost or a random forest for fraud detection?", "technical/risk_engine"),
+    ("Is my transaction data encrypted?", "technical/privacy"),
+    ("What about privacy of merchant descriptions?", "technical/privacy"),
+]
+
+
+def test_committed_index_is_current():
+    index = get_keyword_index()
+    assert index is not None
+    assert index.version == fingerprint(read_documents())
+
+
+def test_labelled_queries_rank_expected_document_first():
+    index = get_keyword_index()
+    top = [index.search(query, k=1) for query, _ in LABELLED_QUERIES]
+    assert [results[0][0]['id'].split('#')[0] for results in top] == [doc for _, doc in LABELLED_QUERIES]
+    assert index.search("hello there") == []
+
+
+def test_bm25_ranking_and_round_trip(tmp_path):
+    documents = [
+        {'id': 'a', 'text': 'fraud alerts and fraud review for cards', 'metadata': {'topic': 'a'}},
+        {'id': 'b', 'text': 'a single mention of fraud among many other unrelated words here',
+         'metadata': {'topic': 'b'}},
+        {'id': 'c', 'text': 'savings goals and budgets', 'metadata': {'topic': 'c'}},
+    ]
+    index = KeywordIndex.build(documents)
+    assert tokenize('Saving savings SAVE') == ['sav', 'sav', 'sav']
+
+    results = index.search('fraud', k=5)
+    assert [chunk['id'] for chunk, _ in results] == ['a#0', 'b#0']
+    assert results[0][1] > results[1][1]
+    # A rarer term outweighs a common one
+    assert index.search('fraud cards', k=1)[0][0]['id'] == 'a#0'
+    assert index.search('fraud words', k=1)[0][0]['id'] == 'b#0'
+
+    index.save(str(tmp_path))
+    loaded = KeywordIndex.load(str(tmp_path))
+    assert loaded.version == index.version
+    for query in ('fraud', 'budget savings', 'unknown'):
+        assert loaded.search(query, k=2) == index.search(query, k=2)
+
+
+def test_rag_service_falls_back_to_keyword_index():
+    service = RAGService.__new__(RAGService)
+    service.collection = None
+    docs = service.query("How should I budget my income?", n_results=2)
+    assert docs and docs[0].startswith("The 50/30/20 budgeting rule")
+    assert len(service.query("risk", n_results=1)) == 1
@@ -0,0 +1,102 @@
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import numpy as np
+
+from src.utils.feature_store import load_user_features
+from src.utils.known_locations import KnownLocations, load_known_locations, record_location
+from src.utils.local_harness import use_fake_firestore, fire_document_created
+from src.utils.risk_engine import RiskEngine
+
+
+def test_sorted_hash_index_membership():
+    index = KnownLocations.from_locations(['Pune', 'Delhi', 'Pune', '', None, 'Goa'])
+    assert len(index) == 3 and np.all(np.diff(index.hashes) > 0)
+    assert 'Pune' in index and 'Goa' in index
+    assert 'Paris' not in index and '' not in index and None not in index
+
+    index = KnownLocations.from_bytes(index.add('Paris').to_bytes())
+    assert len(index) == 4 and 'Paris' in index
+    assert index.add('Paris') is index
+
+    mask = index.contains_many(np.array(['Goa', 'Oslo', '', float('nan'), 'Paris'], dtype=object))
+    assert mask.tolist() == [True, False, False, False, True]
+    assert KnownLocations.from_locations([]).contains_many(['Goa']).tolist() == [False]
+
+
+def test_index_seeded_from_history_and_maintained_by_trigger():
+    from src.triggers.on_transaction_create import on_transaction_create
+
+    db = use_fake_firestore()
+    now = datetime.now()
+    # History from before the index existed
+    db.document('users/k1/transactions/old').set(
+        {'amount': -5, 'location': 'Delhi', 'timestamp': now - timedelta(days=10)})
+    assert load_known_locations('k1') is None
+    assert record_location('k1', 'Pune') is True
+    assert record_location('k1', 'Pune') is False
+    index = load_known_locations('k1')
+    assert 'Delhi' in index and 'Pune' in index and len(index) == 2
+
+    for i, location in enumerate(['Mumbai', 'Mumbai', 'Goa']):
+        tx = {'amount': -200, 'category': 'groceries', 'location': location,
+              'timestamp': now - timedelta(minutes=i)}
+        fire_document_created(on_transaction_create, {'userId': 'k1', 'txId': f't{i}'}, tx,
+                              document_path=f'users/k1/transactions/t{i}')
+    index = load_known_locations('k1')
+    assert len(index) == 4 and all(loc in index for loc in ('Delhi', 'Pune', 'Mumbai', 'Goa'))
+
+    # Scoring reads the index along with the rolling state: Pune never appears in the state's window
+    features = load_user_features('k1')
+    assert 'Pune' not in features.locations and features.has_location('Pune')
+    engine = RiskEngine()
+    assert engine._calculate_location_risk({'location': 'Pune'}, features) == 10
+    assert engine._calculate_location_risk({'location': 'Paris'}, features) == 100
+    batch = {'amount': np.array([50.0, 50.0]), 'timestamp': np.array([now.timestamp()] * 2),
+             'location': np.array(['Pune', 'Paris'], dtype=object)}
+    assert engine.calculate_risk_scores(batch, features)['factors']['location'].tolist() == [10, 100]
+
+
+def test_seed_comes_from_loaded_history_outside_the_transaction(monkeypatch):
+    from src.utils import known_locations
+
+    use_fake_firestore()
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError('history was scanned again')
+    monkeypatch.setattr(known_locations, 'load_history', no_scan)
+
+    history = [{'location': 'Delhi'}, {'location': 'Goa'}, {'location': None}]
+    assert record_location('k2', 'Pune', history) is True
+    assert len(load_known_locations('k2')) == 3 and 'Goa' in load_known_locations('k2')
+    # Once the index exists, no history is needed
+    assert record_location('k2', 'Oslo') is True and record_location('k2', 'Goa') is False
+
+
+def test_state_from_before_the_index_seeds_it_on_next_write(monkeypatch):
+    from src.triggers import on_transaction_create as trigger
+    from src.utils.rolling_state import build_state
+
+    db = use_fake_firestore()
+    now = datetime.now()
+    old = {'amount': -5, 'location': 'Delhi', 'timestamp': now - timedelta(days=3)}
+    db.document('users/k3/transactions/old').set(old)
+    # Rolling state written before the location index existed
+    db.document('users/k3/risk_state/rolling').set(build_state([old], now))
+
+    calls = []
+    monkeypatch.setattr(trigger, 'record_location',
+                        lambda *args: calls.append(args) or record_location(*args))
+    for i in range(2):
+        tx = {'amount': -20, 'category': 'groceries', 'location': 'Delhi', 'timestamp': now}
+        fire_document_created(trigger.on_transaction_create, {'userId': 'k3', 'txId': f't{i}'}, tx,
+                              document_path=f'users/k3/transactions/t{i}')
+
+    assert 'Delhi' in load_known_locations('k3')
+    # Only the first write, which found no marker in the state, touched the index
+    assert len(calls) == 1
+    assert db.document('users/k3/risk_state/rolling').get().to_dict()['locations_indexed'] == 1
@@ -4,7 +4,11 @@ import os
 # Add functions/src to python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.utils.risk_engine import RiskEngine
+import numpy as np
+
+from src.utils.compiled_model import CompiledEnsemble
+from src.utils.model_cache import get_model
+from src.utils.risk_engine import RiskEngine, MODEL_PATH
 
 def test_risk_engine():
     engine = RiskEngine()
@@ -30,5 +34,90 @@ def test_risk_engine():
     else:
         print("FAILURE: Risk score is zero.")
 
+
+def _sample_transactions(n, seed=7):
+    import random
+    rng = random.Random(seed)
+    merchants = ['gambling', 'Crypto', 'electronics', 'travel', 'grocery', '']
+    locations = ['Mumbai', 'Delhi', 'Pune', 'New Location']
+    return [{
+        'amount': rng.choice([0, 250, 501, 999, 1500, 5000, 5001, 12000]) + rng.random(),
+        'time_of_day': rng.randint(0, 23),
+        'location': rng.choice(locations),
+        'merchant_type': rng.choice(merchants),
+        'timestamp': 1_700_000_000 + rng.randint(0, 5 * 86400)
+    } for _ in range(n)]
+
+
+def test_batch_scores_match_single_row():
+    import pandas as pd
+
+    engine = RiskEngine()
+    transactions = _sample_transactions(200)
+    user_history = _sample_transactions(40, seed=11)
+    for t in user_history:
+        t['location'] = t['location'].replace('New Location', 'Mumbai')
+
+    # Batches score with the sklearn ensemble, single rows with its compiled export
+    compiled = engine.calculate_risk_scores(pd.DataFrame(transactions), user_history)
+    assert not isinstance(engine._batch_model(), CompiledEnsemble)
+
+    for model in (get_model(MODEL_PATH), None):
+        engine.model = model
+        batch = engine.calculate_risk_scores(pd.DataFrame(transactions), user_history)
+        for i, transaction in enumerate(transactions):
+            single = engine.calculate_risk_score(transaction, user_history)
+            assert batch['risk_level'][i] == single['risk_level']
+            assert abs(batch['score'][i] - single['score']) < 1e-9
+            for factor, value in single['factors'].items():
+                assert batch['factors'][factor][i] == value
+        if model is not None:
+            assert np.array_equal(compiled['score'], batch['score'])
+
+    print("SUCCESS: Batch scores match the single-row path.")
+
+
+def test_user_history_index_matches_list():
+    from src.utils.user_history import UserHistory, WINDOW_7D
+
+    engine = RiskEngine()
+    transactions = _sample_transactions(50, seed=3)
+    user_history = _sample_transactions(300, seed=5)
+
+    # Build half up front and append the rest out of order
+    index = UserHistory.from_transactions(user_history[:150])
+    for t in reversed(user_history[150:]):
+        index.append(t)
+
+    for transaction in transactions:
+        expected = engine.calculate_risk_score(transaction, user_history)
+        result = engine.calculate_risk_score(transaction, index)
+        assert result['factors'] == expected['factors']
+        assert result['score'] == expected['score']
+
+        end = transaction['timestamp']
+        in_window = [t for t in user_history if end - WINDOW_7D < t['timestamp'] <= end]
+        count, total = index.window(end, WINDOW_7D)
+        assert count == len(in_window)
+        assert abs(total - sum(t['amount'] for t in in_window)) < 1e-6
+
+    print("SUCCESS: UserHistory index matches the list-based factors.")
+
+
+def test_batch_without_timestamps_needs_recent_count():
+    import pytest
+
+    engine = RiskEngine()
+    batch = {'amount': np.array([50.0, 9000.0])}
+    history = [{'timestamp': 1000, 'location': 'NY'}]
+    with pytest.raises(ValueError, match="'timestamp' column"):
+        engine.calculate_risk_scores(batch, history)
+
+    # Without history, or with the counts supplied, no timestamps are needed
+    assert len(engine.calculate_risk_scores(batch)['score']) == 2
+    scored = engine.calculate_risk_scores({**batch, 'recent_count': np.array([0, 4])}, history)
+    assert scored['factors']['frequency'].tolist() == [10, 50]
+
+
 if __name__ == "__main__":
     test_risk_engine()
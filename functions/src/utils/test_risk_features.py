@@ -0,0 +1,56 @@
+import sys
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.risk_features import extract_features, to_columns
+from src.utils.rolling_state import HIGH_RISK_CATEGORIES
+
+
+def _reference(transactions, now):
+    """The trigger's original per-element computation"""
+    amounts = [t.get('amount', 0) for t in transactions]
+    total_7d = sum(a for a, t in zip(amounts, transactions)
+                   if t.get('timestamp', now).replace(tzinfo=None) > now - timedelta(days=7))
+    total_30d = sum(a for a, t in zip(amounts, transactions)
+                    if t.get('timestamp', now).replace(tzinfo=None) > now - timedelta(days=30))
+    high_risk_count = sum(1 for t in transactions if t.get('category', 'unknown') in HIGH_RISK_CATEGORIES)
+    return total_7d, total_30d, high_risk_count
+
+
+def test_matches_per_element_computation():
+    rng = random.Random(7)
+    # Naive, read as UTC whatever the host's time zone
+    now = datetime(2025, 6, 30, 12, 0)
+    categories = ['groceries', 'rent', 'gambling', 'pawn', 'cash_advance', 'salary']
+    transactions = []
+    for i in range(500):
+        tx = {'amount': rng.uniform(-5000, 3000), 'category': rng.choice(categories),
+              'timestamp': (now - timedelta(seconds=rng.randint(0, 60 * 86400))).replace(tzinfo=timezone.utc)}
+        if i % 50 == 0:
+            del tx['category']
+        transactions.append(tx)
+    # Exactly on the 7-day boundary is outside the window
+    transactions.append({'amount': 1.0, 'category': 'rent', 'timestamp': now - timedelta(days=7)})
+
+    features = extract_features(transactions, now)
+    total_7d, total_30d, high_risk_count = _reference(transactions, now)
+    assert abs(features['total_7d'] - total_7d) < 1e-6
+    assert abs(features['total_30d'] - total_30d) < 1e-6
+    assert features['high_risk_count'] == high_risk_count
+    assert features['tx_count'] == len(transactions)
+    assert features['count_7d'] <= features['count_30d'] <= len(transactions)
+
+    columns = to_columns(transactions, now)
+    assert columns['timestamp'].dtype.str == '<M8[us]'
+    assert [columns['categories'][c] for c in columns['category'][:3]] == \
+        [t.get('category', 'unknown') for t in transactions[:3]]
+
+
+def test_empty_history():
+    features = extract_features([])
+    assert features == {'tx_count': 0, 'high_risk_count': 0, 'count_7d': 0, 'total_7d': 0.0,
+                        'count_30d': 0, 'total_30d': 0.0}
@@ -0,0 +1,74 @@
+import sys
+import os
+import random
+from datetime import datetime, timedelta
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.rolling_state import apply_transaction, build_state, is_applied, is_consistent, window_totals
+
+
+def _transactions(n, now, seed=1):
+    rng = random.Random(seed)
+    categories = ['groceries', 'rent', 'gambling', 'pawn', 'salary']
+    return [{
+        'amount': rng.choice([-1, 1]) * rng.randint(1, 20000),
+        'category': rng.choice(categories),
+        'timestamp': now - timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 23))
+    } for _ in range(n)]
+
+
+def test_incremental_state_matches_rebuild():
+    now = datetime(2026, 10, 18, 12, 0)
+    transactions = _transactions(400, now)
+
+    state = build_state(transactions[:200], now)
+    for t in transactions[200:]:
+        state, _ = apply_transaction(state, t, now)
+
+    assert state == build_state(transactions, now)
+    assert is_consistent(state)
+
+    in_window = [t for t in transactions if t['timestamp'].date() > (now - timedelta(days=90)).date()]
+    assert state['tx_count'] == len(in_window)
+
+    total_7d, total_30d = window_totals(state, now)
+    assert total_7d == sum(t['amount'] for t in in_window if t['timestamp'].date() > (now - timedelta(days=7)).date())
+    assert total_30d == sum(t['amount'] for t in in_window if t['timestamp'].date() > (now - timedelta(days=30)).date())
+
+
+def test_expired_buckets_are_dropped():
+    now = datetime(2026, 10, 18, 12, 0)
+    state = build_state([{'amount': 5, 'timestamp': now - timedelta(days=10)}], now)
+
+    later = now + timedelta(days=85)
+    state, expired = apply_transaction(state, {'amount': 7, 'timestamp': later}, later)
+    assert expired == [(now - timedelta(days=10)).strftime('%Y-%m-%d')]
+    assert state['tx_count'] == 1
+
+
+def test_inconsistent_state_is_rejected():
+    now = datetime(2026, 10, 18, 12, 0)
+    state = build_state(_transactions(20, now), now)
+    assert is_consistent(state)
+    assert not is_consistent(None)
+    assert not is_consistent({**state, 'version': 0})
+    assert not is_consistent({**state, 'tx_count': state['tx_count'] + 1})
+
+
+def test_redelivered_transaction_is_applied_once():
+    now = datetime(2026, 10, 18, 12, 0)
+    state = build_state(_transactions(20, now), now)
+    tx = {'amount': 250, 'category': 'groceries', 'timestamp': now}
+
+    once, _ = apply_transaction(state, tx, now, tx_id='t1')
+    again, expired = apply_transaction(once, tx, now + timedelta(minutes=5), tx_id='t1')
+    assert again is once and expired == []
+    assert once['tx_count'] == state['tx_count'] + 1 and is_applied(once, 't1')
+    assert is_consistent(once)
+
+    # Applied ids are only remembered for HOURS_KEPT hours
+    later = now + timedelta(hours=30)
+    pruned, _ = apply_transaction(once, {'amount': 5, 'timestamp': later}, later, tx_id='t2')
+    assert list(pruned['applied']) == ['t2']
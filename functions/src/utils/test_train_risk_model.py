@@ -0,0 +1,51 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import numpy as np
+import pandas as pd
+
+from src.utils.train_risk_model import COLUMNS, generate_synthetic_data, write_synthetic_shards, iter_synthetic_shards, \
+    sample_synthetic_shards
+
+
+def test_generator_is_seeded_and_keeps_label_semantics():
+    df = generate_synthetic_data(400_000, seed=7)
+    assert list(df.columns) == COLUMNS
+    assert df.equals(generate_synthetic_data(400_000, seed=7))
+
+    baseline = (df.amount <= 5000) & (df.time_of_day >= 5) & (df.location_risk == 0) & \
+               (df.merchant_risk == 0) & (df.frequency <= 5)
+    # Base rate 0.01 plus N(0, 0.05) noise clipped at 0 averages to about 0.026
+    assert abs(df.is_fraud[baseline].mean() - 0.026) < 0.005
+    merchant_only = (df.amount <= 5000) & (df.time_of_day >= 5) & (df.location_risk == 0) & \
+                    (df.merchant_risk == 1) & (df.frequency <= 5)
+    assert abs(df.is_fraud[merchant_only].mean() - 0.31) < 0.02
+
+
+def test_shards_round_trip(tmp_path):
+    paths = write_synthetic_shards(str(tmp_path), 25, chunk_size=10, seed=3)
+    assert len(paths) == 3
+
+    shards = list(iter_synthetic_shards(str(tmp_path)))
+    assert [len(shard) for shard in shards] == [10, 10, 5]
+    combined = pd.concat(shards, ignore_index=True)
+    assert list(combined.columns) == COLUMNS
+    assert np.isin(combined.is_fraud, [0, 1]).all()
+
+
+def test_training_sample_is_bounded(tmp_path):
+    write_synthetic_shards(str(tmp_path), 2500, chunk_size=1000, seed=3)
+    full = pd.concat(iter_synthetic_shards(str(tmp_path)), ignore_index=True)
+
+    sample, total = sample_synthetic_shards(str(tmp_path), max_rows=600, seed=1)
+    assert total == 2500 and len(sample) == 600
+    assert list(sample.columns) == COLUMNS
+    # Every sampled row is a row of the data set
+    keys = set(map(tuple, full.to_numpy()))
+    assert all(tuple(row) in keys for row in sample.to_numpy())
+
+    everything, _ = sample_synthetic_shards(str(tmp_path), max_rows=10_000)
+    assert everything.equals(full)
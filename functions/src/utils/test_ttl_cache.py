@@ -0,0 +1,23 @@
+import sys
+import os
+
+# Add functions/src to python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.utils.ttl_cache import TTLCache
+
+
+def test_lru_eviction_and_ttl():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'a' is now most recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    now[0] = 11
+    assert cache.get('a') is None
+    assert cache.stats() == {'hits': 3, 'misses': 2, 'hit_rate': 0.6, 'size': 1}
@@ -12,69 +12,150 @@ from sklearn.metrics import accuracy_score, classification_report
 import pandas as pd
 import numpy as np
 import joblib
+import argparse
 import os
+import sys
 import warnings
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.utils.compiled_model import compile_ensemble
+
 # Suppress warnings for cleaner output
 warnings.filterwarnings('ignore')
 
 # Set seed for reproducibility
 np.random.seed(42)
 
-def generate_synthetic_data(n_samples=2000):
+# Column order of generated data; is_fraud is the label
+COLUMNS = ['amount', 'time_of_day', 'location_risk', 'merchant_risk', 'frequency', 'is_fraud']
+
+# The ensemble fits in memory, so training on shards uses a uniform sample of at most this many rows
+MAX_TRAIN_ROWS = int(os.environ.get('RISK_MODEL_MAX_TRAIN_ROWS', '2000000'))
+
+def _generate_columns(n_samples, rng):
+    """
+    Generates one chunk of synthetic transactions as a dict of NumPy columns.
+
+    Vectorized form of the original per-row loop: same feature distributions
+    and the same label probability (base rate plus per-factor risk, Gaussian
+    noise, capped to [0, 0.95]).
+    """
+    # Features
+    amount = rng.exponential(scale=500, size=n_samples)  # Most transactions are small
+    time_of_day = rng.integers(0, 24, size=n_samples, dtype=np.int8)
+    
+    # 0: Low risk location, 1: High risk location
+    location_risk = (rng.random(n_samples) < 0.1).astype(np.int8)
+    
+    # 0: Normal merchant, 1: High risk merchant (gambling, crypto)
+    merchant_risk = (rng.random(n_samples) < 0.05).astype(np.int8)
+    
+    # Frequency of recent transactions (simulated)
+    frequency = rng.poisson(lam=2, size=n_samples).astype(np.int16)
+    
+    # Determine Label (Fraud/High Risk = 1, Legit = 0)
+    risk_prob = np.full(n_samples, 0.01)
+    risk_prob += 0.4 * (amount > 5000)
+    risk_prob += 0.15 * (time_of_day < 5)  # Late night
+    risk_prob += 0.25 * location_risk
+    risk_prob += 0.3 * merchant_risk
+    risk_prob += 0.2 * (frequency > 5)
+    
+    # Add random noise and cap probability
+    risk_prob += rng.normal(0, 0.05, size=n_samples)
+    np.clip(risk_prob, 0.0, 0.95, out=risk_prob)
+    
+    is_fraud = (rng.random(n_samples) < risk_prob).astype(np.int8)
+    
+    return {
+        'amount': amount,
+        'time_of_day': time_of_day,
+        'location_risk': location_risk,
+        'merchant_risk': merchant_risk,
+        'frequency': frequency,
+        'is_fraud': is_fraud
+    }
+
+def generate_synthetic_data(n_samples=2000, seed=42):
     """
     Generates synthetic transaction data for training an ensemble risk model.
     """
-    data = []
-    
-    for _ in range(n_samples):
-        # Features
-        amount = np.random.exponential(scale=500) # Most transactions are small
-        time_of_day = np.random.randint(0, 24)
-        
-        # 0: Low risk location, 1: High risk location
-        location_risk = np.random.choice([0, 1], p=[0.9, 0.1])
-        
-        # 0: Normal merchant, 1: High risk merchant (gambling, crypto)
-        merchant_risk = np.random.choice([0, 1], p=[0.95, 0.05])
-        
-        # Frequency of recent transactions (simulated)
-        frequency = np.random.poisson(lam=2)
-        
-        # Determine Label (Fraud/High Risk = 1, Legit = 0)
-        # Base probability
-        risk_prob = 0.01
-        
-        # Add risk factors with varying weights
-        if amount > 5000: risk_prob += 0.4
-        if time_of_day < 5: risk_prob += 0.15 # Late night
-        if location_risk == 1: risk_prob += 0.25
-        if merchant_risk == 1: risk_prob += 0.3
-        if frequency > 5: risk_prob += 0.2
-        
-        # Add random noise
-        noise = np.random.normal(0, 0.05)
-        risk_prob += noise
-        
-        # Cap probability
-        risk_prob = min(max(risk_prob, 0.0), 0.95)
-        
-        is_fraud = np.random.choice([0, 1], p=[1-risk_prob, risk_prob])
-        
-        data.append({
-            'amount': amount,
-            'time_of_day': time_of_day,
-            'location_risk': location_risk,
-            'merchant_risk': merchant_risk,
-            'frequency': frequency,
-            'is_fraud': is_fraud
-        })
-        
-    return pd.DataFrame(data)
-
-def train_ensemble_model():
-    print("Generating synthetic data for Ensemble training...")
-    df = generate_synthetic_data(3000)
+    return pd.DataFrame(_generate_columns(n_samples, np.random.default_rng(seed)), columns=COLUMNS)
+
+def write_synthetic_shards(output_dir, n_samples, chunk_size=1_000_000, seed=42, fmt='npy'):
+    """
+    Generates n_samples rows in chunks and writes each chunk straight to disk.
+
+    fmt='npy' writes one directory per shard with a .npy file per column, which
+    can be memory-mapped back; fmt='parquet' writes one Parquet file per shard
+    (requires pyarrow). Only one chunk is held in memory at a time, so the
+    output can be far larger than RAM. Returns the list of shard paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_shards = -(-n_samples // chunk_size)
+    # Independent, reproducible stream per shard
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    paths = []
+    for index, shard_seed in enumerate(seeds):
+        rows = min(chunk_size, n_samples - index * chunk_size)
+        columns = _generate_columns(rows, np.random.default_rng(shard_seed))
+        if fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            path = os.path.join(output_dir, f'shard_{index:05d}.parquet')
+            pq.write_table(pa.table(columns), path)
+        elif fmt == 'npy':
+            path = os.path.join(output_dir, f'shard_{index:05d}')
+            os.makedirs(path, exist_ok=True)
+            for name, values in columns.items():
+                np.save(os.path.join(path, f'{name}.npy'), values)
+        else:
+            raise ValueError(f"Unknown shard format: {fmt}")
+        paths.append(path)
+    return paths
+
+def iter_synthetic_shards(data_dir, mmap=True):
+    """Yields one DataFrame per shard written by write_synthetic_shards, in shard order."""
+    for entry in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, entry)
+        if entry.endswith('.parquet'):
+            yield pd.read_parquet(path)
+        elif entry.startswith('shard_') and os.path.isdir(path):
+            yield pd.DataFrame({
+                name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                for name in COLUMNS
+            }, columns=COLUMNS)
+
+def sample_synthetic_shards(data_dir, max_rows=MAX_TRAIN_ROWS, seed=42):
+    """
+    Uniform random sample of at most max_rows rows across all shards in data_dir.
+
+    Each shard contributes in proportion to its size. Shards are read one at
+    a time and .npy columns stay memory-mapped, so only the sampled rows are
+    copied into memory.
+    """
+    sizes = [len(shard) for shard in iter_synthetic_shards(data_dir)]
+    total = sum(sizes)
+    if not total:
+        raise ValueError(f"No synthetic shards found in {data_dir}")
+    rng = np.random.default_rng(seed)
+    # Spread max_rows over the shards so the sample is uniform over all rows
+    take = rng.multivariate_hypergeometric(np.array(sizes), min(max_rows, total))
+    parts = []
+    for shard, size, n in zip(iter_synthetic_shards(data_dir), sizes, take):
+        rows = np.sort(rng.choice(size, size=n, replace=False)) if n < size else slice(None)
+        parts.append(pd.DataFrame({name: np.asarray(shard[name].to_numpy()[rows]) for name in COLUMNS},
+                                  columns=COLUMNS))
+    return pd.concat(parts, ignore_index=True), total
+
+def train_ensemble_model(data_dir=None, max_rows=MAX_TRAIN_ROWS):
+    if data_dir:
+        print(f"Sampling up to {max_rows} rows from synthetic shards in {data_dir}...")
+        df, total = sample_synthetic_shards(data_dir, max_rows)
+        print(f"Training on {len(df)} of {total} rows")
+    else:
+        print("Generating synthetic data for Ensemble training...")
+        df = generate_synthetic_data(3000)
     
     X = df.drop('is_fraud', axis=1)
     y = df['is_fraud']
@@ -137,5 +218,24 @@ def train_ensemble_model():
     joblib.dump(eclf, output_path)
     print(f"Ensemble Model saved to {output_path}")
 
+    # Export the NumPy-compiled predictor used by RiskEngine at request time
+    compiled_path = os.path.join(os.path.dirname(__file__), 'risk_model.npz')
+    compile_ensemble(eclf).save(compiled_path)
+    print(f"Compiled predictor saved to {compiled_path}")
+
 if __name__ == "__main__":
-    train_ensemble_model()
+    parser = argparse.ArgumentParser(description="Train the ensemble risk model on synthetic data.")
+    parser.add_argument('--generate', metavar='DIR', help='Write synthetic shards to DIR instead of training')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows to generate with --generate')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Rows per shard')
+    parser.add_argument('--format', choices=['npy', 'parquet'], default='npy')
+    parser.add_argument('--data-dir', help='Train on shards from this directory')
+    parser.add_argument('--max-rows', type=int, default=MAX_TRAIN_ROWS,
+                        help='Rows sampled from --data-dir for training')
+    args = parser.parse_args()
+
+    if args.generate:
+        shards = write_synthetic_shards(args.generate, args.rows, args.chunk_size, fmt=args.format)
+        print(f"Wrote {args.rows} rows in {len(shards)} shards to {args.generate}")
+    else:
+        train_ensemble_model(args.data_dir, args.max_rows)
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Common lookbacks in seconds
+WINDOW_24H = 86400
+WINDOW_7D = 7 * 86400
+WINDOW_30D = 30 * 86400
+
+
+class UserHistory:
+    """
+    Per-user transaction history kept sorted by timestamp in NumPy arrays.
+
+    Window counts and sums are answered with binary search over the sorted
+    timestamps plus a prefix sum of amounts, so each lookup is O(log n)
+    regardless of how active the user is. Appends in timestamp order are
+    amortized O(1); out-of-order appends shift the tail instead of rebuilding.
+    """
+
+    def __init__(self, capacity=64):
+        capacity = max(int(capacity), 1)
+        self._timestamps = np.empty(capacity, dtype=float)
+        self._amounts = np.empty(capacity, dtype=float)
+        # _cumsum[i] is the sum of the first i amounts
+        self._cumsum = np.zeros(capacity + 1, dtype=float)
+        self._size = 0
+        self.locations = set()
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """Builds the index from a list of transaction dicts in any order."""
+        history = cls(capacity=len(transactions))
+        if not transactions:
+            return history
+        timestamps = np.array([t['timestamp'] for t in transactions], dtype=float)
+        amounts = np.array([t.get('amount', 0) for t in transactions], dtype=float)
+        order = np.argsort(timestamps, kind='stable')
+        n = len(transactions)
+        history._timestamps[:n] = timestamps[order]
+        history._amounts[:n] = amounts[order]
+        np.cumsum(history._amounts[:n], out=history._cumsum[1:n + 1])
+        history._size = n
+        history.locations = {t['location'] for t in transactions if 'location' in t}
+        return history
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def timestamps(self):
+        """Sorted timestamps as a read-only view."""
+        view = self._timestamps[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def amounts(self):
+        """Amounts aligned with timestamps as a read-only view."""
+        view = self._amounts[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def append(self, transaction):
+        """Adds one transaction without rebuilding the index."""
+        timestamp = float(transaction['timestamp'])
+        amount = float(transaction.get('amount', 0))
+        if self._size == len(self._timestamps):
+            self._grow()
+
+        n = self._size
+        if n == 0 or timestamp >= self._timestamps[n - 1]:
+            pos = n
+        else:
+            pos = int(np.searchsorted(self._timestamps[:n], timestamp, side='right'))
+            self._timestamps[pos + 1:n + 1] = self._timestamps[pos:n]
+            self._amounts[pos + 1:n + 1] = self._amounts[pos:n]
+
+        self._timestamps[pos] = timestamp
+        self._amounts[pos] = amount
+        self._size = n + 1
+        if pos == n:
+            self._cumsum[n + 1] = self._cumsum[n] + amount
+        else:
+            np.cumsum(self._amounts[pos:n + 1], out=self._cumsum[pos + 1:n + 2])
+            self._cumsum[pos + 1:n + 2] += self._cumsum[pos]
+
+        if 'location' in transaction:
+            self.locations.add(transaction['location'])
+
+    def _grow(self):
+        capacity = len(self._timestamps) * 2
+        for name in ('_timestamps', '_amounts'):
+            grown = np.empty(capacity, dtype=float)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+        cumsum = np.zeros(capacity + 1, dtype=float)
+        cumsum[:self._size + 1] = self._cumsum[:self._size + 1]
+        self._cumsum = cumsum
+
+    def _bounds(self, start, end):
+        ts = self._timestamps[:self._size]
+        lo = int(np.searchsorted(ts, start, side='right'))
+        hi = self._size if end is None else int(np.searchsorted(ts, end, side='right'))
+        return lo, max(lo, hi)
+
+    def count_since(self, start):
+        """Number of transactions with timestamp > start."""
+        lo, hi = self._bounds(start, None)
+        return hi - lo
+
+    def window(self, end, lookback):
+        """Returns (count, total amount) for transactions with end - lookback < timestamp <= end."""
+        lo, hi = self._bounds(end - lookback, end)
+        return hi - lo, float(self._cumsum[hi] - self._cumsum[lo])
+
+    def count_in_window(self, end, lookback):
+        """Number of transactions in the lookback window ending at end."""
+        return self.window(end, lookback)[0]
+
+    def sum_in_window(self, end, lookback):
+        """Total amount of transactions in the lookback window ending at end."""
+        return self.window(end, lookback)[1]
+
+    def has_location(self, location):
+        """Whether the user has transacted from this location before."""
+        return location in self.locations